@@ -1,148 +1,328 @@
+"""
+Microservice B: Recurring Transactions
+
+Listens on ZeroMQ REP at tcp://*:5557 for "add_recurring" and "apply_recurring"
+commands. A background scheduler keeps a min-heap of each rule's next due date
+and wakes up only when the earliest one is due, so recurring transactions are
+posted on time without clients asking and without rescanning the collection.
+Schedules follow the calendar rules in recurrence.py.
+
+{"command": "stats"} returns request and MongoDB latency metrics (see
+metrics.py); scheduler runs are recorded as "scheduled_apply".
+"""
+import heapq
+import json
+import logging
+import threading
+import time
 import zmq
-from pymongo import MongoClient
-from datetime import datetime, timedelta
+from pymongo import MongoClient, ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+from datetime import datetime, timedelta, timezone
 import os
 from dotenv import load_dotenv
+import goal_progress
+import rollups
+from ledger_version import bump_version
+from recurrence import build_transaction, expand_occurrences, first_occurrence, migrate_recurrence, validate_frequency
+from metrics import MongoCommandTimer, ServiceMetrics, setup_logging
 
-# Load environment variables
-load_dotenv()
-
-# MongoDB URI from .env
-uri = os.getenv("MONGODB_URI")
-if not uri:
-    raise ValueError("MONGODB_URI is not set in .env")
-
-# Connect to MongoDB 
-client = MongoClient(uri)
-
-try:
-    client.admin.command("ping")
-    print("Connected to MongoDB")
-except Exception as e:
-    print(f"Failed to connect to MongoDB: {e}")
-    exit(1)
-
-# Database and collections
-recurring_db = client["RecurringTransactions"]
-recurring_col = recurring_db["recurringTransactions"]
-budget_db = client["budgetwise_db"]
-transactions_col = budget_db["transactions"]
-
-# ZeroMQ REP socket setup
-context = zmq.Context()
-socket = context.socket(zmq.REP)
-socket.bind("tcp://*:5557")
-
-# Frequency to days mapping
-FREQUENCY_TO_DAYS = {
-    "daily": 1,
-    "bi-weekly": 14,
-    "monthly": 30 
-}
-
-def apply_recurring_transactions():
-    today = datetime.today().date()
-    print(f"Applying recurring transactions for {today}")
-    processed = []
-
-    for doc in recurring_col.find():
-        print(f"Checking doc: {doc}")
-
-        freq = doc.get("recurrence", {}).get("frequency")
-        next_due_str = doc.get("recurrence", {}).get("next_due")
-
-        print(f"Frequency: {freq}, Next Due: {next_due_str}")
-
-        if not freq or not next_due_str:
-            print("missing frequency or next_due")
-            continue
+DUPLICATE_KEY_ERROR = 11000
 
-        try:
-            next_due = datetime.strptime(next_due_str, "%Y-%m-%d").date()
-        except ValueError:
-            print(f"invalid date format for next_due: {next_due_str}")
+log = logging.getLogger("MicroserviceB")
+metrics = ServiceMetrics("MicroserviceB")
+
+# Longest the scheduler sleeps before re-checking, in case the clock changes
+MAX_SLEEP_SECONDS = 3600
+
+# Database and collections, set by connect()
+client = None
+recurring_col = None
+budget_db = None
+transactions_col = None
+
+# Connects to MongoDB and creates the indexes the service relies on
+def connect():
+    global client, recurring_col, budget_db, transactions_col
+
+    # Load environment variables
+    load_dotenv()
+
+    # MongoDB URI from .env
+    uri = os.getenv("MONGODB_URI")
+    if not uri:
+        raise ValueError("MONGODB_URI is not set in .env")
+
+    client = MongoClient(uri, event_listeners=[MongoCommandTimer(metrics)])
+
+    try:
+        client.admin.command("ping")
+        log.info("Connected to MongoDB")
+    except Exception as e:
+        log.error("Failed to connect to MongoDB: %s", e)
+        exit(1)
+
+    recurring_col = client["RecurringTransactions"]["recurringTransactions"]
+    budget_db = client["budgetwise_db"]
+    transactions_col = budget_db["transactions"]
+
+    # Due rules are found by next_due, and each occurrence can only be posted once
+    recurring_col.create_index([("recurrence.next_due", ASCENDING)])
+    transactions_col.create_index(
+        [("recurring_key", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"recurring_key": {"$exists": True}},
+    )
+
+
+# Brings rules saved by older versions up to the current calendar rules
+def migrate_rules():
+    """
+    Returns the number of rules changed. Rules whose frequency was not
+    recognized run monthly from now on and keep the stored value in
+    recurrence.original_frequency.
+    """
+    updates = []
+    for doc in recurring_col.find({}, {"recurrence": 1}):
+        changes = migrate_recurrence(doc.get("recurrence", {}))
+        if not changes:
             continue
+        if "original_frequency" in changes:
+            log.warning("Recurring transaction %s has unknown frequency %r; it now runs monthly",
+                        doc["_id"], changes["original_frequency"])
+        updates.append(UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": {f"recurrence.{field}": value for field, value in changes.items()}},
+        ))
+    if updates:
+        recurring_col.bulk_write(updates, ordered=False)
+        log.info("Migrated %d recurring transaction(s)", len(updates))
+    return len(updates)
+
+
+class RecurringScheduler:
+    """
+    Min-heap of (next_due, rule_id). Rescheduling a rule pushes a new entry;
+    stale entries are skipped when popped.
+    """
 
-        print(f"Today: {today}, Next Due: {next_due}")
+    def __init__(self):
+        self._heap = []
+        self._next_due = {}
+        self._wakeup = threading.Condition()
 
-        if today >= next_due:
-            print("Processing transaction")
+    # Adds or moves a rule's next due date
+    def schedule(self, rule_id, next_due):
+        with self._wakeup:
+            self._next_due[rule_id] = next_due
+            heapq.heappush(self._heap, (next_due, str(rule_id), rule_id))
+            self._wakeup.notify()
 
-            amount = doc.get("amount", 0)
-            txn_type = doc.get("type")
-            if not txn_type:
-                txn_type = "income" if amount > 0 else "expense"
+    # Loads every rule's next due date once at startup
+    def load(self):
+        for doc in recurring_col.find({}, {"recurrence.next_due": 1}):
+            next_due_str = doc.get("recurrence", {}).get("next_due")
+            try:
+                self.schedule(doc["_id"], datetime.strptime(next_due_str, "%Y-%m-%d").date())
+            except (TypeError, ValueError):
+                log.warning("Not scheduling recurring transaction %s: bad next_due %s", doc["_id"], next_due_str)
 
-            # Makes sure expense is negative and income is positive
-            if txn_type == "expense" and amount > 0:
-                amount = -abs(amount)
-            elif txn_type == "income" and amount < 0:
-                amount = abs(amount)
+    # Blocks until at least one rule is due, then returns the due rule ids
+    def wait_for_due(self):
+        with self._wakeup:
+            while True:
+                today = datetime.today().date()
+                due_ids = []
+                while self._heap and self._heap[0][0] <= today:
+                    next_due, _, rule_id = heapq.heappop(self._heap)
+                    if self._next_due.get(rule_id) == next_due:
+                        del self._next_due[rule_id]
+                        due_ids.append(rule_id)
+                if due_ids:
+                    return due_ids
 
-            transaction = {
-                "date": str(today),
-                "type": txn_type,
-                "description": doc.get("description", "no description"),
-                "category": doc.get("category", "uncategorized"),
-                "amount": amount
-            }
+                timeout = MAX_SLEEP_SECONDS
+                if self._heap:
+                    wake_at = datetime.combine(self._heap[0][0], datetime.min.time())
+                    timeout = min(timeout, max((wake_at - datetime.now()).total_seconds(), 0))
+                self._wakeup.wait(timeout)
 
+    def run(self):
+        while True:
+            due_ids = self.wait_for_due()
+            started = time.perf_counter()
             try:
-                insert_result = transactions_col.insert_one(transaction)
-                print(f"Inserted transaction with id {insert_result.inserted_id}")
+                apply_recurring_transactions(due_ids)
+                metrics.observe("scheduled_apply", time.perf_counter() - started)
             except Exception as e:
-                print(f"Failed to insert transaction: {e}")
+                log.exception("Scheduled run failed: %s", e)
+                metrics.error("scheduled_apply")
+                # Try these rules again later instead of dropping them
+                retry_at = datetime.today().date() + timedelta(days=1)
+                for rule_id in due_ids:
+                    self.schedule(rule_id, retry_at)
+
+
+scheduler = RecurringScheduler()
+apply_lock = threading.Lock()
+
+# Inserts transactions, skipping any whose recurring_key was already posted
+def insert_new_transactions(transactions):
+    """
+    Returns the transactions that were actually inserted.
+    """
+    stamp = datetime.now(timezone.utc)
+    for transaction in transactions:
+        transaction["updated_at"] = stamp
+    try:
+        transactions_col.insert_many(transactions, ordered=False)
+        return transactions
+    except BulkWriteError as e:
+        failed = set()
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") != DUPLICATE_KEY_ERROR:
+                raise
+            failed.add(error["index"])
+        log.info("Skipped %d recurring transaction(s) that were already posted", len(failed))
+        return [txn for i, txn in enumerate(transactions) if i not in failed]
+
+def apply_recurring_transactions(rule_ids=None):
+    """
+    Posts every missed occurrence of each due recurring rule and moves its
+    next_due past today. Only rules with next_due <= today are read, limited to
+    rule_ids when the scheduler passes them.
+    """
+    with apply_lock:
+        today = datetime.today().date()
+        log.debug("Applying recurring transactions for %s", today)
+        query = {"recurrence.next_due": {"$lte": str(today)}}
+        if rule_ids is not None:
+            query["_id"] = {"$in": list(rule_ids)}
+
+        pending = []
+        updates = []
+        rescheduled = []
+
+        for doc in recurring_col.find(query):
+            recurrence = doc.get("recurrence", {})
+            freq = recurrence.get("frequency")
+            next_due_str = recurrence.get("next_due")
+
+            if not freq or not next_due_str:
+                log.warning("Recurring transaction %s is missing frequency or next_due", doc["_id"])
                 continue
 
-            # Updates the next_due date based on frequency
-            delta_days = FREQUENCY_TO_DAYS.get(freq, 30)
-            new_due_date = next_due + timedelta(days=delta_days)
             try:
-                update_result = recurring_col.update_one(
-                    {"_id": doc["_id"]},
-                    {"$set": {"recurrence.next_due": str(new_due_date)}}
+                next_due = datetime.strptime(next_due_str, "%Y-%m-%d").date()
+                # Catch up on every occurrence that was missed
+                occurrences, due = expand_occurrences(
+                    next_due, freq, today, recurrence.get("anchor_day")
                 )
-                print(f"Updated recurring transaction: {update_result.matched_count}, modified: {update_result.modified_count}")
-            except Exception as e:
-                print(f"Failed to update recurring transaction: {e}")
+            except ValueError as e:
+                log.warning("Skipping recurring transaction %s: %s", doc["_id"], e)
+                continue
 
-            processed.append(transaction)
-        else:
-            print("Not due yet")
+            pending.extend(build_transaction(doc, occurrence) for occurrence in occurrences)
 
-    return processed
+            # Only advances next_due if no other run already moved it
+            updates.append(UpdateOne(
+                {"_id": doc["_id"], "recurrence.next_due": next_due_str},
+                {"$set": {"recurrence.next_due": str(due)}}
+            ))
+            rescheduled.append((doc["_id"], due))
 
+        if not pending:
+            return []
 
-print("Microservice B Running on port 5557")
-while True:
-    try:
-        message = socket.recv_json()
-        command = message.get("command")
+        processed = insert_new_transactions(pending)
+        update_result = recurring_col.bulk_write(updates, ordered=False)
+        log.info("Inserted %d transaction(s), advanced %d recurring transaction(s)",
+                 len(processed), update_result.modified_count)
 
-        if command == "add_recurring":
-            try:
-                transaction = message["transaction"]
-                recurring_col.insert_one(transaction)
-                processed = apply_recurring_transactions()
-                socket.send_json({
-                    "status": "ok",
-                    "processed_count": len(processed)
-                })
-            except Exception as e:
-                socket.send_json({"status": "error", "message": str(e)})
+        for rule_id, due in rescheduled:
+            scheduler.schedule(rule_id, due)
 
-        elif command == "apply_recurring":
-            try:
-                processed = apply_recurring_transactions()
-                socket.send_json({
-                    "status": "ok",
-                    "processed_count": len(processed)
-                })
-            except Exception as e:
-                socket.send_json({"status": "error", "message": str(e)})
+        if processed:
+            rollups.apply_transactions(budget_db, processed)
+            goal_progress.apply_transactions(budget_db, processed)
+            bump_version(budget_db)
+        return processed
 
-        else:
-            socket.send_json({"status": "error", "message": "Unknown command"})
-    except Exception as e:
-        # In case of JSON decoding errors or others
-        socket.send_json({"status": "error", "message": f"Server error: {str(e)}"})
+# Stores a new recurring rule and schedules it
+def add_recurring(transaction):
+    """
+    Returns the transactions posted right away when the rule is already due.
+    """
+    recurrence = transaction.setdefault("recurrence", {})
+    frequency = recurrence.get("frequency")
+    validate_frequency(frequency)
+    start = datetime.strptime(recurrence.get("next_due", ""), "%Y-%m-%d").date()
+    start = first_occurrence(start, frequency)
+    recurrence["next_due"] = str(start)
+    recurrence["anchor_day"] = start.day
+
+    rule_id = recurring_col.insert_one(transaction).inserted_id
+    if start <= datetime.today().date():
+        return apply_recurring_transactions([rule_id])
+    scheduler.schedule(rule_id, start)
+    return []
+
+# Answers one command
+def handle_command(message):
+    command = message.get("command")
+
+    if command == "add_recurring":
+        try:
+            processed = add_recurring(message["transaction"])
+            return {"status": "ok", "processed_count": len(processed)}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+    if command == "apply_recurring":
+        try:
+            processed = apply_recurring_transactions()
+            return {"status": "ok", "processed_count": len(processed)}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+    if command == "stats":
+        return {"status": "ok", "metrics": metrics.snapshot()}
+
+    return {"status": "error", "message": "Unknown command"}
+
+def main():
+    setup_logging()
+    metrics.start_prometheus_dump()
+    connect()
+
+    # ZeroMQ REP socket setup
+    context = zmq.Context()
+    socket = context.socket(zmq.REP)
+    socket.bind("tcp://*:5557")
+
+    migrate_rules()
+    scheduler.load()
+    threading.Thread(target=scheduler.run, daemon=True).start()
+
+    log.info("Microservice B running on port 5557")
+    while True:
+        message = socket.recv()
+        started = time.perf_counter()
+        command = "invalid"
+        try:
+            request = json.loads(message)
+            command = str(request.get("command"))
+            log.debug("Request %s", command)
+            reply = handle_command(request)
+        except Exception as e:
+            # In case of JSON decoding errors or others
+            reply = {"status": "error", "message": f"Server error: {str(e)}"}
+        if reply["status"] == "error":
+            log.warning("%s failed: %s", command, reply["message"])
+            metrics.error(command)
+        payload = json.dumps(reply).encode()
+        socket.send(payload)
+        metrics.observe(command, time.perf_counter() - started, len(message), len(payload))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+BudgetWise benchmark suite
+
+Builds a reproducible synthetic ledger (transactions, recurring rules, budget
+goals and savings) and times every entry point against it:
+  - budget_app: view_budget, view_transactions, view_budget_goals,
+    export_transactions and tracked goal recomputes, on the MongoDB backend
+    and on an SQLite copy of the same ledger, plus loading and
+    delta-refreshing the session transaction cache
+  - analytics: loading the columnar ledger and its pivot, balance, moving
+    average and top-N reports
+  - Microservice A: month, type and date-range filters, cold and cached
+  - Microservice B: apply_recurring_transactions
+  - Microservice C: chart aggregation and rendering
+  - Microservice D: savings totals, monthly and entry pages
+
+The services' request handlers are called directly, so no ZeroMQ servers need
+to be running. Use a local mongod for real numbers (the benchmark only touches
+the database named with --database, which it drops first); mongomock works
+without a server but is only useful for small sizes.
+
+Examples:
+    python benchmark.py --backend mongomock --sizes 10000
+    python benchmark.py --uri mongodb://localhost:27017 --sizes 10000,100000,1000000 --save bench_baseline.json
+    python benchmark.py --uri mongodb://localhost:27017 --sizes 100000 --baseline bench_baseline.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import types
+from datetime import date, timedelta
+
+INSERT_BATCH_SIZE = 10000
+REGRESSION_THRESHOLD = 1.2
+
+CATEGORIES = {
+    "income": ["payroll", "freelance", "interest", "refund"],
+    "expense": ["rent", "food", "transport", "utilities", "entertainment", "health", "shopping"],
+    "savings": ["emergency fund", "retirement", "vacation"],
+}
+DESCRIPTIONS = ["target", "bestbuy", "google", "costco", "amazon", "landlord", "employer", "bank"]
+FREQUENCIES = ["daily", "weekly", "bi-weekly", "monthly", "end-of-month", "yearly"]
+
+# Connects to the benchmark database
+def open_database(backend, uri, database):
+    if backend == "mongomock":
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        from pymongo import MongoClient
+        client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+        client.admin.command("ping")
+    client.drop_database(database)
+    return client, client[database]
+
+# Inserts documents in fixed-size batches
+def insert_batched(collection, docs):
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+# Yields `size` reproducible transactions spread over the last few years
+def generate_transactions(rng, size, years=5):
+    start = date.today() - timedelta(days=365 * years)
+    span = 365 * years
+    for _ in range(size):
+        roll = rng.random()
+        txn_type = "income" if roll < 0.2 else "savings" if roll < 0.3 else "expense"
+        amount = round(rng.uniform(5, 3000 if txn_type == "income" else 400), 2)
+        yield {
+            "date": str(start + timedelta(days=rng.randrange(span))),
+            "type": txn_type,
+            "description": rng.choice(DESCRIPTIONS),
+            "category": rng.choice(CATEGORIES[txn_type]),
+            "amount": -amount if txn_type == "expense" else amount,
+        }
+
+# Builds recurring rules that are all due, with a few missed occurrences each
+def generate_recurring(rng, count):
+    rules = []
+    for _ in range(count):
+        start = date.today() - timedelta(days=rng.randrange(1, 60))
+        rules.append({
+            "description": rng.choice(DESCRIPTIONS),
+            "amount": -round(rng.uniform(5, 200), 2),
+            "category": rng.choice(CATEGORIES["expense"]),
+            "recurrence": {
+                "frequency": rng.choice(FREQUENCIES),
+                "next_due": str(start),
+                "anchor_day": start.day,
+            },
+        })
+    return rules
+
+# Builds budget goals; every other one tracks a year of spending in one category
+def generate_goals(rng, count):
+    goals = []
+    year_ago = str(date.today() - timedelta(days=365))
+    for i in range(count):
+        goal = {
+            "goal_name": f"goal {i}",
+            "target_amount": round(rng.uniform(500, 10000), 2),
+            "current_amount": round(rng.uniform(0, 500), 2),
+        }
+        if i % 2:
+            goal.update({
+                "tracked": True,
+                "direction": -1,
+                "category": rng.choice(CATEGORIES["expense"]),
+                "type": None,
+                "date_from": year_ago,
+                "date_to": None,
+            })
+        goals.append(goal)
+    return goals
+
+# Fills the database with a synthetic ledger of the given size
+def generate_ledger(db, size, seed):
+    import goal_progress
+    import rollups
+
+    rng = random.Random(seed)
+    insert_batched(db.transactions, generate_transactions(rng, size))
+    db.recurring.insert_many(generate_recurring(rng, max(10, size // 1000)))
+    db.budget_goals.insert_many(generate_goals(rng, 20))
+    rollups.rebuild_rollups(db)
+    goal_progress.recompute_goals(db)
+
+# Copies the generated ledger into an SQLite repository
+def load_sqlite(db, path):
+    import storage
+
+    repo = storage.SQLiteRepository(path)
+    batch = []
+    for doc in db.transactions.find({}, {"_id": 0, "date": 1, "type": 1, "description": 1, "category": 1, "amount": 1}):
+        batch.append(doc)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            repo.add_transactions(batch)
+            batch = []
+    if batch:
+        repo.add_transactions(batch)
+    for goal in db.budget_goals.find({}, {"_id": 0}):
+        repo.add_goal(goal)
+    return repo
+
+# Makes the app and service modules importable against the benchmark database
+def load_modules(db, uri):
+    """
+    budget_app and Microservice D connect through module-level clients, so
+    their storage accessors are pointed at the benchmark database.
+    """
+    os.environ.setdefault("MONGODB_URI", uri)
+    if "db_connection" not in sys.modules:
+        stand_in = types.ModuleType("db_connection")
+        stand_in.get_db = lambda: db
+        sys.modules["db_connection"] = stand_in
+
+    import budget_app
+    import storage
+    import microserviceA
+    import MicroserviceB
+    import microserviceC
+    import microserviceD
+
+    mongo_repo = storage.MongoRepository(db)
+    budget_app.get_repository = lambda: mongo_repo
+    microserviceD.get_db = lambda: db
+    MicroserviceB.budget_db = db
+    MicroserviceB.transactions_col = db.transactions
+    MicroserviceB.recurring_col = db.recurring
+    return types.SimpleNamespace(
+        app=budget_app, A=microserviceA, B=MicroserviceB, C=microserviceC, D=microserviceD, mongo=mongo_repo
+    )
+
+# Times fn `repeat` times, calling setup (untimed) before each run
+def measure(fn, repeat, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - started)
+    return {"median": statistics.median(samples), "min": min(samples), "runs": repeat}
+
+# Returns {name: (fn, setup)} for every benchmarked operation
+def operations(db, modules, workdir, sqlite_repo):
+    import analytics
+
+    app, A, B, C, D = modules.app, modules.A, modules.B, modules.C, modules.D
+    month = (date.today() - timedelta(days=90)).strftime("%Y-%m")
+    recent_from = str(date.today() - timedelta(days=30))
+
+    # Points budget_app at a storage backend with a warm session cache and starts the pager over
+    caches = {}
+
+    def use(repo):
+        def setup():
+            app.get_repository = lambda: repo
+            if id(repo) not in caches:
+                caches[id(repo)] = app.transaction_cache.TransactionCache(repo)
+                caches[id(repo)].load()
+            app.session_cache = caches[id(repo)]
+            app.pager = None
+        return setup
+
+    # Edits one transaction behind the cache's back so the next refresh has a delta to fetch
+    def touch_one():
+        use(modules.mongo)()
+        app.session_cache.refresh()
+        row = db.transactions.find_one({}, {"_id": 1})
+        modules.mongo.update_transaction(str(row["_id"]), {"description": f"touched {time.time()}"})
+
+    def reset_recurring():
+        db.transactions.delete_many({"recurring_key": {"$exists": True}})
+        for rule in db.recurring.find({}, {"recurrence": 1}):
+            start = date.today() - timedelta(days=45)
+            db.recurring.update_one(
+                {"_id": rule["_id"]},
+                {"$set": {"recurrence.next_due": str(start), "recurrence.anchor_day": start.day}},
+            )
+
+    ledger = analytics.load_ledger(sqlite_repo)
+    year_ago = analytics.months_back(12)
+
+    ops = {
+        "app.view_budget": (app.view_budget, use(modules.mongo)),
+        "app.view_transactions": (app.view_transactions, use(modules.mongo)),
+        "app.export_transactions.csv": (
+            lambda: app.transaction_export.export_transactions(modules.mongo, path=os.path.join(workdir, "t.csv")),
+            None),
+        "app.export_transactions.csv_gz": (
+            lambda: app.transaction_export.export_transactions(
+                modules.mongo, compress=True, path=os.path.join(workdir, "t.csv.gz")), None),
+        "app.cache_load": (lambda: app.transaction_cache.TransactionCache(modules.mongo).load(), None),
+        "app.cache_refresh_changed": (app.view_transactions, touch_one),
+        "app.view_budget_goals": (app.view_budget_goals, use(modules.mongo)),
+        "goals.recompute": (modules.mongo.recompute_goal_progress, None),
+        "sqlite.view_budget": (app.view_budget, use(sqlite_repo)),
+        "sqlite.goals_recompute": (sqlite_repo.recompute_goal_progress, None),
+        "sqlite.view_transactions": (app.view_transactions, use(sqlite_repo)),
+        "sqlite.filter_month": (lambda: sqlite_repo.find_transactions({"month": month}), None),
+        "sqlite.export_transactions.csv": (
+            lambda: app.transaction_export.export_transactions(sqlite_repo, path=os.path.join(workdir, "s.csv")),
+            None),
+        "analytics.load": (lambda: analytics.load_ledger(sqlite_repo), None),
+        "analytics.pivot_category": (lambda: ledger.pivot("category", kind="expenses"), None),
+        "analytics.running_balance": (ledger.running_balance, None),
+        "analytics.moving_average": (lambda: ledger.moving_average(3), None),
+        "analytics.top_categories": (lambda: ledger.top_categories(5, year_ago), None),
+        "analytics.largest": (lambda: ledger.largest(10, year_ago), None),
+        "A.filter_month": (lambda: A.respond({"month": month}, db.transactions), A.cache.clear),
+        "A.filter_type": (lambda: A.respond({"type": "income"}, db.transactions), A.cache.clear),
+        "A.filter_date_amount": (
+            lambda: A.respond({"from": recent_from, "min_amount": 100}, db.transactions), A.cache.clear),
+        "A.filter_month_cached": (
+            lambda: A.respond({"month": month}, db.transactions), lambda: A.respond({"month": month}, db.transactions)),
+        "A.batch_summary": (
+            lambda: A.respond({"batch": [{"totals": True}, {"recent": 20}]}, db.transactions), A.cache.clear),
+        "B.apply_recurring": (B.apply_recurring_transactions, reset_recurring),
+        "C.income_expense": (lambda: C.generate_chart(db, "income_expense"), C.chart_cache.clear),
+        "C.monthly_trend": (lambda: C.generate_chart(db, "monthly_trend"), C.chart_cache.clear),
+        "D.totals": (lambda: D.handle_command({"command": "totals"}), None),
+        "D.monthly": (lambda: D.handle_command({"command": "monthly"}), None),
+        "D.entries_page": (lambda: D.handle_command({"command": "entries"}), None),
+    }
+    return ops
+
+# Prints results next to the baseline and returns the regressed operations
+def compare(results, baseline):
+    regressions = []
+    for size, ops in results.items():
+        print(f"\n=== {size} transactions ===")
+        print(f"{'operation':32} {'median':>10} {'min':>10} {'baseline':>10} {'ratio':>7}")
+        for name, timing in ops.items():
+            base = baseline.get(size, {}).get(name)
+            line = f"{name:32} {timing['median'] * 1000:9.2f}ms {timing['min'] * 1000:9.2f}ms"
+            if base:
+                ratio = timing["median"] / base["median"] if base["median"] else float("inf")
+                flag = "  REGRESSION" if ratio > REGRESSION_THRESHOLD else ""
+                line += f" {base['median'] * 1000:9.2f}ms {ratio:6.2f}x{flag}"
+                if flag:
+                    regressions.append(f"{size}:{name}")
+            print(line)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BudgetWise against a synthetic ledger.")
+    parser.add_argument("--backend", choices=("mongod", "mongomock"), default="mongod")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="budgetwise_bench")
+    parser.add_argument("--sizes", default="10000", help="comma separated transaction counts, e.g. 10000,1000000")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help="comma separated operation names to run")
+    parser.add_argument("--baseline", help="JSON file with earlier results to compare against")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help=f"exit with status 1 if any operation is {REGRESSION_THRESHOLD}x slower than the baseline")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    only = set(args.only.split(",")) if args.only else None
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            client, db = open_database(args.backend, args.uri, args.database)
+            print(f"Generating {size} transactions (seed {args.seed})...")
+            started = time.perf_counter()
+            generate_ledger(db, size, args.seed)
+            print(f"Generated in {time.perf_counter() - started:.1f}s")
+
+            modules = load_modules(db, args.uri)
+            sqlite_repo = load_sqlite(db, os.path.join(workdir, f"bench-{size}.db"))
+            results[str(size)] = {}
+            for name, (fn, setup) in operations(db, modules, workdir, sqlite_repo).items():
+                if only and name not in only:
+                    continue
+                results[str(size)][name] = measure(fn, args.repeat, setup)
+                print(f"  {name}: {results[str(size)][name]['median'] * 1000:.2f}ms")
+            client.drop_database(args.database)
+
+    regressions = compare(results, baseline)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.save}")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
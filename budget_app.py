@@ -1,16 +1,65 @@
-from db_connection import get_db
-from bson.objectid import ObjectId
-import os
-from tabulate import tabulate
 import time
-import csv
-import zmq
-import certifi
-from datetime import datetime
-from pymongo import MongoClient
-import json
-from PIL import Image
+STARTED = time.perf_counter()
+
+import importlib.util
 import io
+import os
+import sys
+from datetime import datetime
+import db_connection
+from budget_summary import month_range
+import profiling
+
+# Imports a module the first time one of its attributes is used
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition(".")
+    if parent:
+        # A normal import also makes a submodule an attribute of its package
+        setattr(sys.modules[parent], child, module)
+    return module
+
+# Heavy modules load on first use instead of before the menu draws; pymongo
+# itself is first imported by the background connection thread
+LAZY_MODULES = {
+    "storage": lazy_import("storage"),
+    "analytics": lazy_import("analytics"),
+    "transaction_export": lazy_import("transaction_export"),
+    "transaction_pager": lazy_import("transaction_pager"),
+    "transaction_cache": lazy_import("transaction_cache"),
+    "tabulate": lazy_import("tabulate"),
+    "zmq_client": lazy_import("zmq_client"),
+    "PIL.Image": lazy_import("PIL.Image"),
+}
+storage = LAZY_MODULES["storage"]
+analytics = LAZY_MODULES["analytics"]
+transaction_export = LAZY_MODULES["transaction_export"]
+transaction_pager = LAZY_MODULES["transaction_pager"]
+transaction_cache = LAZY_MODULES["transaction_cache"]
+tabulate = LAZY_MODULES["tabulate"]
+zmq_client = LAZY_MODULES["zmq_client"]
+Image = LAZY_MODULES["PIL.Image"]
+
+# Storage backend (MongoDB or SQLite, see storage.py) shared by every screen
+def get_repository():
+    return storage.get_repository()
+
+# Session cache of the transactions, written through to the storage backend
+session_cache = None
+
+def get_transactions():
+    global session_cache
+    if session_cache is None:
+        session_cache = transaction_cache.TransactionCache(get_repository())
+        session_cache.refresh()
+    return session_cache
 
 # Displays title of application in ASCII Artstyle 
 def title():
@@ -55,9 +104,10 @@ def transaction_management_menu():
     print("2. Delete a transaction")
     print("3. Edit transactions")
     print("4. Export transactions")
-    print("5. View chart of income vs expenses")
+    print("5. View charts of your transactions")
     print("6. Update recurring transactions")
-    print("7. Back to main menu")
+    print("7. Bulk delete transactions")
+    print("8. Back to main menu")
 
 # Displays the budget goals menu
 def budget_goals_menu():
@@ -68,7 +118,8 @@ def budget_goals_menu():
     print("1. Create a new budget goal")
     print("2. Update a budget goal")
     print("3. Delete a budget goal")
-    print("4. Back to main menu")
+    print("4. Bulk delete budget goals")
+    print("5. Back to main menu")
 
 # Validates the date input from the user
 def get_valid_date(prompt="Enter the date (YYYY-MM-DD): "):
@@ -80,13 +131,25 @@ def get_valid_date(prompt="Enter the date (YYYY-MM-DD): "):
         except ValueError:
             print("Invalid date format. Please enter as YYYY-MM-DD.")
 
+# Asks for a date that may be left blank, returns None when it is
+def get_optional_date(prompt):
+    while True:
+        date_str = input(prompt).strip()
+        if not date_str:
+            return None
+        try:
+            datetime.strptime(date_str, "%Y-%m-%d")
+            return date_str
+        except ValueError:
+            print("Invalid date format. Please enter as YYYY-MM-DD.")
+
 # adds transactions to the database
+@profiling.profiled
 def add_transaction():
     """
-    Function to add a transaction to MongoDB.
+    Function to add a transaction to the database.
     """
-    db = get_db()
-    transactions = db.transactions
+    cache = get_transactions()
 
     date = get_valid_date()
     type = input("Enter the type (Income/Expense/Savings/Custom) (Note: Be consistent with custom types): ").strip().lower()
@@ -101,7 +164,7 @@ def add_transaction():
         print("Please enter 'y' or 'n'.")
 
     if is_recurring == "y":
-        frequency = input("Enter recurrence frequency (daily/bi-weekly/monthly): ").strip().lower()
+        frequency = input("Enter recurrence frequency (daily/weekly/bi-weekly/monthly/end-of-month/yearly): ").strip().lower()
         add_recurring_transaction(
             description=description,
             amount=amount,
@@ -120,88 +183,37 @@ def add_transaction():
         "amount": amount
     }
 
-    result = transactions.insert_one(transaction)
-    print(f"Transaction saved with ID: {result.inserted_id}\n")
-
-# MicroserviceB - adds a recurring transaction
-def add_recurring_transaction(description, amount, category, start_date, frequency):
-    """
-    Function to add a recurring transaction via the microservice.
-    """
-    context = zmq.Context()
-    socket = context.socket(zmq.REQ)
-    socket.connect("tcp://localhost:5557")
-
-    socket.send_json({
-        "command": "add_recurring",
-        "transaction": {
-            "description": description,
-            "amount": amount,
-            "category": category,
-            "recurrence": {
-                "frequency": frequency,
-                "next_due": start_date
-            }
-        }
-    })
-
-    res = socket.recv_json()
-    if res.get("status") == "ok":
-        applied_count = res.get("processed_count", 0)
-        print(f"Added recurring transactions. {applied_count} transaction(s) was applied.\n")
-    else:
-        print(f"Failed: {res.get('message')}\n")
-    print("Returning to Transaction Management Menu...")
-    time.sleep(5)
-
-# MicroserviceC - creates a graph of transactions
-def create_graph_microserviceC():
-    context = zmq.Context()
-    socket = context.socket(zmq.REQ)
-    socket.connect("tcp://localhost:5554")
-
-    # Send chart request
-    socket.send_string("generate_chart")
-
-    # Receive binary image data
-    data = socket.recv()
-    
-    # Check if it's a string error instead
-    if data.startswith(b"Error") or data.startswith(b"No data"):
-        print(data.decode())
-        return
-
-    # Load and show the image using PIL
-    image = Image.open(io.BytesIO(data))
-    image.show()  # Opens in default image viewer (or Preview/Photos)
-
-    print("Chart displayed.")
+    transaction_id = cache.add_transaction(transaction)
+    print(f"Transaction saved with ID: {transaction_id}\n")
 
 # Allows the user to edit transactions in the database
+@profiling.profiled
 def edit_transactions():
     """
-    Function that lets a user edit their transactions in MongoDB, allows editing multiple times until the user exits.
+    Function that lets a user edit their transactions in the database, allows editing multiple times until the user exits.
     """
-    db = get_db()
-    transactions = db.transactions
+    repo = get_repository()
+    cache = get_transactions()
 
     while True:
         clear_screen()
         view_transactions()
 
         transaction_id = input("\nEnter the transaction ID to edit (or type 'cancel' to return to the menu): ").strip()
+        if page_transactions(transaction_id.lower()):
+            continue
         if transaction_id.lower() == 'cancel':
             print("Update cancelling...")
             time.sleep(2)
             clear_screen()
             break
 
-        if not ObjectId.is_valid(transaction_id):
+        if not repo.is_valid_id(transaction_id):
             print("Invalid transaction ID. Please try again.\nPage will auto refresh in 5 seconds.")
             time.sleep(5)
             continue
 
-        transaction = transactions.find_one({"_id": ObjectId(transaction_id)})
+        transaction = cache.get_transaction(transaction_id)
 
         if transaction:
             print("\n--- Current Transaction ---")
@@ -230,23 +242,26 @@ def edit_transactions():
                 update_fields['amount'] = float(update_amount)
 
             if update_fields:
-                transactions.update_one({"_id": ObjectId(transaction_id)}, {"$set": update_fields})
+                cache.update_transaction(transaction_id, update_fields)
                 print("Your transaction were updated.\n")
             else:
                 print("No changes were made.\n")
 
 # deletes transactions in the database
+@profiling.profiled
 def delete_transaction():
     """
     Function to delete a transaction.
     """
-    db = get_db()
-    transactions = db.transactions
+    repo = get_repository()
+    cache = get_transactions()
 
     while True:
         clear_screen()
         view_transactions()
         transaction_id = input("Enter the transaction ID to delete (or type 'cancel' to go back): ").strip()
+        if page_transactions(transaction_id.lower()):
+            continue
 
         if transaction_id.lower() == 'cancel':
             print("Cancelling deletion...")
@@ -254,28 +269,130 @@ def delete_transaction():
             clear_screen()
             break
 
-        for transaction in transactions.find():
-            if str(transaction['_id']) == transaction_id:
-                confirm = input("Are you sure you want to delete this transaction? (Doing so will permanently delete it.) (y/n): ").strip().lower()
-                if confirm == 'y':
-                    transactions.delete_one({'_id': transaction['_id']})
-                    print("Transaction successfully deleted.")
-                    time.sleep(2)
-                    clear_screen()
-                    return
-                else:
-                    print("Deletion cancelled.")
-                    time.sleep(2)
-                    clear_screen()
-                    return
+        if not repo.is_valid_id(transaction_id):
+            print("Invalid transaction ID. Please try again. Page will auto refresh in 5 seconds.")
+            time.sleep(5)
+            continue
+
+        transaction = cache.get_transaction(transaction_id)
+        if transaction:
+            confirm = input("Are you sure you want to delete this transaction? (Doing so will permanently delete it.) (y/n): ").strip().lower()
+            if confirm == 'y':
+                cache.delete_transaction(transaction_id)
+                print("Transaction successfully deleted.")
+            else:
+                print("Deletion cancelled.")
+            time.sleep(2)
+            clear_screen()
+            return
 
         print("Transaction ID not found. Please try again. Page will auto refresh in 5 seconds.")
         time.sleep(5)
 
-# display transactions in a table format
+# Parses a comma separated list of IDs, returns None if any ID is invalid
+def parse_object_ids(text):
+    repo = get_repository()
+    ids = [part.strip() for part in text.split(",") if part.strip()]
+    if not ids or not all(repo.is_valid_id(i) for i in ids):
+        return None
+    return ids
+
+# Deletes many transactions at once, chosen by ID list or by filter
+@profiling.profiled
+def bulk_delete_transactions():
+    """
+    Function to delete many transactions with a single bulk delete.
+    Shows how many transactions match before asking for confirmation.
+    """
+    cache = get_transactions()
+
+    clear_screen()
+    print("1) Delete by transaction IDs")
+    print("2) Delete by filter (month, type, category)")
+    choice = input("Choose an option [1-2] (or type 'cancel' to go back): ").strip().lower()
+
+    if choice == '1':
+        ids = parse_object_ids(input("Enter the transaction IDs separated by commas: "))
+        if ids is None:
+            print("One or more transaction IDs are invalid.")
+            time.sleep(3)
+            return
+        filters = {"ids": ids}
+    elif choice == '2':
+        filters = {}
+        month = input("Enter month (YYYY-MM) (leave blank for any): ").strip()
+        tx_type = input("Enter type (leave blank for any): ").strip().lower()
+        category = input("Enter category (leave blank for any): ").strip().lower()
+        if month:
+            try:
+                month_range(month)
+            except ValueError:
+                print("Invalid month format. Please enter as YYYY-MM.")
+                time.sleep(3)
+                return
+            filters["month"] = month
+        if tx_type:
+            filters["type"] = tx_type
+        if category:
+            filters["category"] = category
+        if not filters:
+            print("Enter at least one filter.")
+            time.sleep(3)
+            return
+    else:
+        print("Cancelling deletion...")
+        time.sleep(2)
+        return
+
+    count = cache.count_transactions(filters)
+    if count == 0:
+        print("No transactions match.")
+        time.sleep(3)
+        return
+
+    confirm = input(f"{count} transaction(s) will be permanently deleted. Continue? (y/n): ").strip().lower()
+    if confirm != 'y':
+        print("Deletion cancelled.")
+        time.sleep(2)
+        return
+
+    deleted = cache.delete_transactions(filters)
+    print(f"{deleted} transaction(s) successfully deleted.")
+    time.sleep(2)
+
+# Shared pager so every screen keeps the page the user is on
+pager = None
+
+def get_pager():
+    global pager
+    if pager is None:
+        pager = transaction_pager.TransactionPager(get_transactions())
+        pager.first()
+    return pager
+
+# Moves the transaction table to the next ('n') or previous ('p') page
+def page_transactions(direction):
+    """
+    Returns True if the input was a page command.
+    """
+    if direction == 'n':
+        if not get_pager().next():
+            print("Already on the last page.")
+            time.sleep(1)
+        return True
+    if direction == 'p':
+        if not get_pager().prev():
+            print("Already on the first page.")
+            time.sleep(1)
+        return True
+    return False
+
+# display one page of transactions in a table format
+@profiling.profiled
 def view_transactions():
-    db = get_db()
-    transactions = db.transactions.find()
+    get_transactions().refresh()
+    current = get_pager()
+    transactions = current.refresh()
 
     table = []
     headers = ["Transaction ID", "Date", "Type", "Description", "Category", "Amount"]
@@ -292,7 +409,8 @@ def view_transactions():
         table.append(row)
 
     print("\n--- Transactions ---")
-    print(tabulate(table, headers=headers, tablefmt="fancy_grid"))
+    print(tabulate.tabulate(table, headers=headers, tablefmt="fancy_grid"))
+    print(f"Page {current.page_number}{'' if current.has_next else ' (last)'} - type 'n' for next page, 'p' for previous page")
 
 # Displays the response from the microservice in a clean table format
 def display_response(resp):
@@ -310,125 +428,124 @@ def display_response(resp):
                 d.get("category", ""),
                 f"${d.get('amount', 0):.2f}"
             ])
-        print(tabulate(rows, headers=headers, tablefmt="fancy_grid"))
-
-# MicroserviceA - Calls the microservice to filter transactions based on user input
-def call_microserviceA(req):
-    MICRO_URL = "tcp://localhost:5555"
-    ctx  = zmq.Context()
-    sock = ctx.socket(zmq.REQ)
-    sock.connect(MICRO_URL)
-    sock.send_json(req)
-    resp = sock.recv_json()
-    print("Filtered Results:")
-    display_response(resp)
-
-# Filters transactions by month, type, or ID
-def view_transactions_by_type():
-    while True:
-        clear_screen()
-        print("=== Quick Budget Summary ===")
-        view_budget()
-        print("\n=== All Transactions ===\n")
-        view_transactions()
-        print("\n--- Filter Transactions ---\n")
-        print("1) Filter by Month (YYYY-MM)")
-        print("2) Filter by Type (income/expense)")
-        print("3) Filter by Transaction ID")
-        print("4) Exit")
-        choice = input("Choose an option [1-4]: ").strip()
-
-        if choice == '4':
-            print("Returning to previous menu...")
-            break
-        if choice == '1':
-            month = input("Enter month (YYYY-MM): ").strip()
-            req = {"month": month}
-        elif choice == '2':
-            tx_type = input("Enter type (income/expense): ").strip().lower()
-            req = {"type": tx_type}
-        elif choice == '3':
-            txn_id = input("Enter Transaction ID: ").strip()
-            req = {"id": txn_id}
-        else:
-            print("Invalid choice.")
-            time.sleep(1)
-            continue
-
-        call_microserviceA(req)
-        again = input("\nPress Enter to filter again; any other button to exit ")
-        if again != "":
-            print("Goodbye!")
-            break
+        print(tabulate.tabulate(rows, headers=headers, tablefmt="fancy_grid"))
 
 # Displays a brief budget overview
+@profiling.profiled
 def view_budget():
     """
     Function to view the budget.
     """
-    db = get_db()
-    transactions = db.transactions.find()
-    income = 0
-    expenses = 0
-    for transaction in transactions:
-        amount = transaction['amount']
-        if amount >= 0:
-            income += amount
-        else:
-            expenses += amount
-    print(f"\nTotal Income: ${income:.2f}")
-    print(f"Total Expenses: ${expenses:.2f}")
-    print(f"Net Spending: ${income + expenses:.2f}")
+    cache = get_transactions()
+    cache.refresh()
+    print_totals(cache.totals())
+
+# Displays monthly net, top expense categories and largest expenses
+@profiling.profiled
+def view_spending_report():
+    """
+    Function to view a spending report computed over the whole ledger.
+    """
+    months = input("How many months should the report cover? (default 12): ").strip()
+    try:
+        months = int(months) if months else 12
+    except ValueError:
+        print("Invalid number of months.")
+        return
+    cache = get_transactions()
+    cache.refresh()
+    analytics.print_report(analytics.Ledger.from_rows(cache.all_transactions()), months)
+
+# Prints income, expense and net totals
+def print_totals(totals):
+    if totals.get("error"):
+        print(f"Error: {totals['error']}")
+        return
+    print(f"\nTotal Income: ${totals['income']:.2f}")
+    print(f"Total Expenses: ${totals['expenses']:.2f}")
+    print(f"Net Spending: ${totals['net']:.2f}")
 
 # Creates a budget goal in the database
+@profiling.profiled
 def create_budget_goal():
     """
     Function to create a budget goal.
     """
-    db = get_db()
-    budget_goals = db.budget_goals
+    repo = get_repository()
     clear_screen()
     goal_name = input("Enter the name of the budget goal: ").strip()
     target_amount = float(input("Enter the target amount: $"))
-    current_amount = float(input("Enter the current amount: $"))
 
     budget_goal = {
         "goal_name": goal_name,
         "target_amount": target_amount,
-        "current_amount": current_amount
     }
 
-    budget_goals.insert_one(budget_goal)
+    track = input("Track this goal's progress from your transactions? (y/n): ").strip().lower()
+    if track == 'y':
+        budget_goal.update(get_goal_tracking())
+    else:
+        budget_goal["current_amount"] = float(input("Enter the current amount: $"))
+
+    repo.add_goal(budget_goal)
+
+# Asks which transactions a tracked goal counts (see goal_progress.py)
+def get_goal_tracking():
+    category = input("Category to track (leave blank for any): ").strip().lower()
+    tx_type = input("Type to track (leave blank for any): ").strip().lower()
+    date_from = get_optional_date("Start date (YYYY-MM-DD) (leave blank for no start): ")
+    date_to = get_optional_date("End date (YYYY-MM-DD) (leave blank for no end): ")
+    counts = input("Count money spent or money received? (spent/received): ").strip().lower()
+    return {
+        "tracked": True,
+        "direction": -1 if counts.startswith("s") else 1,
+        "category": category or None,
+        "type": tx_type or None,
+        "date_from": date_from,
+        "date_to": date_to,
+    }
+
+# Describes what a goal tracks for the goals table
+def describe_tracking(goal):
+    if not goal.get("tracked"):
+        return "manual"
+    parts = [goal.get("category") or "any category", goal.get("type") or "any type"]
+    if goal.get("date_from") or goal.get("date_to"):
+        parts.append(f"{goal.get('date_from') or '...'} to {goal.get('date_to') or '...'}")
+    return ("spent: " if goal.get("direction") == -1 else "received: ") + ", ".join(parts)
 
 # Displays the budget goals in a table format
+@profiling.profiled
 def view_budget_goals():
     """
     Function to view budget goals.
     """
-    db = get_db()
-    budget_goals = db.budget_goals.find()
+    budget_goals = get_repository().list_goals()
     print("\n--- Budget Goals ---")
     table = []
-    headers = ["Goal ID", "Goal", "Target Amount", "Current Amount"]
+    headers = ["Goal ID", "Goal", "Tracks", "Target Amount", "Current Amount", "Progress"]
 
     for goal in budget_goals:
+        # Tracked goals are kept current on every transaction write
+        progress = f"{goal['current_amount'] / goal['target_amount'] * 100:.0f}%" if goal['target_amount'] else "-"
         row = [
             str(goal["_id"]),
             goal["goal_name"],
+            describe_tracking(goal),
             f"${goal['target_amount']:.2f}",
             f"${goal['current_amount']:.2f}",
-
+            progress,
         ]
         table.append(row)
-    print(tabulate(table, headers=headers, tablefmt="fancy_grid"))
+    print(tabulate.tabulate(table, headers=headers, tablefmt="fancy_grid"))
 
 # Updates a budget goal in the database
+@profiling.profiled
 def update_budget_goal():
     """
     Function to update a budget goal.
     """
-    db = get_db()
-    budget_goals = db.budget_goals
+    repo = get_repository()
 
     while True:
         clear_screen()
@@ -441,44 +558,57 @@ def update_budget_goal():
             time.sleep(2)
             break
 
-        if not ObjectId.is_valid(goal_id):
+        if not repo.is_valid_id(goal_id):
             print("Invalid budget goal ID. Please try again.\nPage will auto refresh in 5 seconds.")
             time.sleep(5)
             continue
 
-        budget_goal = budget_goals.find_one({"_id": ObjectId(goal_id)})
+        budget_goal = repo.get_goal(goal_id)
 
         if budget_goal:
             print(f"\nCurrent budget goal: {budget_goal}")
             print(f"Goal          : {budget_goal['goal_name']}")
             print(f"Target Amount : ${budget_goal['target_amount']}")
-            print(f"Current Amount: ${budget_goal['current_amount']}\n")
+            print(f"Current Amount: ${budget_goal['current_amount']}")
+            print(f"Tracks        : {describe_tracking(budget_goal)}\n")
 
             update_goal_name = input("Enter new goal name (leave blank if for no change): ").strip()
             update_target_amount = input("Enter new target amount (leave blank for no change): $").strip()
-            update_current_amount = input("Enter new current amount (leave blank for no change): $").strip()
 
             update_fields = {}
             if update_goal_name:
                 update_fields['goal_name'] = update_goal_name
             if update_target_amount:
                 update_fields['target_amount'] = float(update_target_amount)
-            if update_current_amount:
-                update_fields['current_amount'] = float(update_current_amount)
+
+            if budget_goal.get("tracked"):
+                tracking = input("Change which transactions this goal tracks? (y/n/stop): ").strip().lower()
+            else:
+                tracking = input("Track this goal's progress from your transactions? (y/n): ").strip().lower()
+            if tracking == 'y':
+                update_fields.update(get_goal_tracking())
+            elif tracking == 'stop':
+                update_fields['tracked'] = False
+
+            # Tracked goals get their current amount from the transactions
+            if not update_fields.get('tracked', budget_goal.get('tracked')):
+                update_current_amount = input("Enter new current amount (leave blank for no change): $").strip()
+                if update_current_amount:
+                    update_fields['current_amount'] = float(update_current_amount)
 
             if update_fields:
-                budget_goals.update_one({"_id": ObjectId(goal_id)}, {"$set": update_fields})
+                repo.update_goal(goal_id, update_fields)
                 print("Your budget goal was successfully updated.")
             else:
                 print("No changes were made to your Goals.")
 
 # Deletes a budget goal in the database
+@profiling.profiled
 def delete_budget_goal():
     """
-    Function to delete a budget goal in mongodb.
+    Function to delete a budget goal in the database.
     """
-    db = get_db()
-    budget_goals = db.budget_goals
+    repo = get_repository()
 
     while True:
         clear_screen()
@@ -490,71 +620,117 @@ def delete_budget_goal():
             time.sleep(2)
             break
 
-        for goal in budget_goals.find():
-            if str(goal['_id']) == goal_id:
-                confirm = input("Are you sure you want to delete this goal? (Doing so will delete all progress.) (y/n): ").strip().lower()
-                if confirm == 'y':
-                    print("Budget goal successfully deleted.")
-                    time.sleep(2)
-                    budget_goals.delete_one({'_id': goal['_id']})
-                    return
-                else:
-                    print("Deletion cancelled.")
-                    time.sleep(2)
-                    break
-        
+        goal = repo.get_goal(goal_id) if repo.is_valid_id(goal_id) else None
+
+        if goal:
+            confirm = input("Are you sure you want to delete this goal? (Doing so will delete all progress.) (y/n): ").strip().lower()
+            if confirm == 'y':
+                print("Budget goal successfully deleted.")
+                time.sleep(2)
+                repo.delete_goals([goal_id])
+                return
+            else:
+                print("Deletion cancelled.")
+                time.sleep(2)
+                continue
+
         print("Budget goal ID not found. Please try again. Page is refreshing...")
         time.sleep(2)
 
-# Exports transactions to a CSV file
-def export_transactions():
+# Deletes many budget goals at once
+@profiling.profiled
+def bulk_delete_budget_goals():
     """
-    Function to export transactions to a CSV file.
+    Function to delete several budget goals with a single bulk delete.
     """
-    db = get_db()
-    transactions = db.transactions.find()
+    repo = get_repository()
 
-    with open('transactions.csv', 'w', newline='') as csvfile:
-        headers = ['Transaction ID', 'Date', 'Type', 'Description', 'Category', 'Amount']
-        writer = csv.DictWriter(csvfile, fieldnames=headers)
+    clear_screen()
+    view_budget_goals()
+    text = input("Enter the budget goal IDs separated by commas (or type 'cancel' to go back): ").strip()
+    if text.lower() == 'cancel':
+        print("Cancelling deletion...")
+        time.sleep(2)
+        return
 
-        writer.writeheader()
-        for transaction in transactions:
-            writer.writerow({
-                'Transaction ID': str(transaction['_id']),
-                'Date': transaction['date'],
-                'Type': transaction['type'],
-                'Description': transaction['description'],
-                'Category': transaction['category'],
-                'Amount': transaction['amount']
-            })
+    ids = parse_object_ids(text)
+    if ids is None:
+        print("One or more budget goal IDs are invalid.")
+        time.sleep(3)
+        return
 
-    print("Transactions were exported to transactions.csv.")
+    count = repo.count_goals(ids)
+    if count == 0:
+        print("No budget goals match.")
+        time.sleep(3)
+        return
+
+    confirm = input(f"{count} budget goal(s) and their progress will be deleted. Continue? (y/n): ").strip().lower()
+    if confirm == 'y':
+        deleted = repo.delete_goals(ids)
+        print(f"{deleted} budget goal(s) successfully deleted.")
+    else:
+        print("Deletion cancelled.")
+    time.sleep(2)
+
+# Exports transactions to a CSV or Parquet file
+@profiling.profiled
+def export_transactions():
+    """
+    Function to export transactions to a CSV (optionally gzipped) or Parquet file.
+    """
+    repo = get_repository()
+
+    fmt = input("Enter export format (csv/csv.gz/parquet) (leave blank for csv): ").strip().lower() or "csv"
+    if fmt not in {"csv", "csv.gz", "parquet"}:
+        print("Unknown format, exporting as csv.")
+        fmt = "csv"
+    incremental = input("Only export transactions added since the last export? (y/n): ").strip().lower() == 'y'
+
+    try:
+        path, count = transaction_export.export_transactions(
+            repo,
+            fmt="parquet" if fmt == "parquet" else "csv",
+            compress=fmt == "csv.gz",
+            incremental=incremental,
+        )
+        print(f"{count} transaction(s) were exported to {path}.")
+    except RuntimeError as e:
+        print(e)
     print("Returning to Transaction Management Menu...")
     time.sleep(3)
 
-# MicroserviceA - Calls the microservice to filter transactions based on user input
+# MicroserviceA - Shows the results of a filter
 def call_microserviceA(req):
-    MICRO_URL = "tcp://localhost:5555"
-    ctx  = zmq.Context()
-    sock = ctx.socket(zmq.REQ)
-    sock.connect(MICRO_URL)
-    sock.send_json(req)
-    resp = sock.recv_json()
+    """
+    Shows each chunk of results as soon as the storage backend returns it
+    (with MongoDB, Microservice A sends them in chunks).
+    """
     print("Filtered Results:")
-    display_response(resp)
+    try:
+        for resp in get_repository().filter_transactions(req):
+            display_response(resp)
+    except zmq_client.ServiceUnavailable as e:
+        print(e)
 
 # Filters transactions by month, type, or ID
+@profiling.profiled
 def view_transactions_by_type():
  
     while True:
-        req = {"filter":"Send a filtered table"}
-        call_microserviceA(req)
         clear_screen()
-        print("=== Quick Budget Summary ===")
-        view_budget()
-        print("\n=== All Transactions ===\n")
-        view_transactions()
+        # Summary and latest transactions come back together (one batch request with MongoDB)
+        try:
+            totals, recent = get_repository().transaction_summary(transaction_pager.PAGE_SIZE)
+        except ValueError as e:
+            print(f"Error: {e}")
+        except zmq_client.ServiceUnavailable as e:
+            print(e)
+        else:
+            print("=== Quick Budget Summary ===")
+            print_totals(totals)
+            print("\n=== Latest Transactions ===\n")
+            display_response(recent)
         print("\n--- Filter Transactions ---\n")
         print("1) Filter by Month (YYYY-MM)")
         print("2) Filter by Type (income/expense)")
@@ -586,64 +762,83 @@ def view_transactions_by_type():
             break
 
 # apply updates to recurring transactions
+@profiling.profiled
 def apply_recurring_transactions():
     """
     Function to apply recurring transactions.
     """
-    context = zmq.Context()
-    socket = context.socket(zmq.REQ)
-    socket.connect("tcp://localhost:5557")
-
-    # Send command to apply recurring transactions
-    socket.send_json({"command": "apply_recurring"})
-
-    # Wait for reply
-    response = socket.recv_json()
+    try:
+        response = {"status": "ok", "processed_count": get_repository().apply_recurring()}
+    except ValueError as e:
+        response = {"status": "error", "message": str(e)}
+    except zmq_client.ServiceUnavailable as e:
+        print(e)
+        return
     print("Response:", response)
 
 # MicroserviceB - adds a recurring transaction
 def add_recurring_transaction(description, amount, category, start_date, frequency):
     """
-    Function to add a recurring transaction via the microservice.
-    """
-    context = zmq.Context()
-    socket = context.socket(zmq.REQ)
-    socket.connect("tcp://localhost:5557")
-
-    socket.send_json({
-        "command": "add_recurring",
-        "transaction": {
-            "description": description,
-            "amount": amount,
-            "category": category,
-            "recurrence": {
-                "frequency": frequency,
-                "next_due": start_date
-            }
+    Function to add a recurring transaction through the storage backend.
+    """
+    rule = {
+        "description": description,
+        "amount": amount,
+        "category": category,
+        "recurrence": {
+            "frequency": frequency,
+            "next_due": start_date
         }
-    })
+    }
 
-    res = socket.recv_json()
-    if res.get("status") == "ok":
-        applied_count = res.get("processed_count", 0)
+    try:
+        applied_count = get_repository().add_recurring_rule(rule)
         print(f"Added recurring transactions. {applied_count} transaction(s) was applied.\n")
-    else:
-        print(f"Failed: {res.get('message')}\n")
+    except ValueError as e:
+        print(f"Failed: {e}\n")
+    except zmq_client.ServiceUnavailable as e:
+        print(f"Failed: {e}\n")
     print("Returning to Transaction Management Menu...")
     time.sleep(5)
 
+# Last chart of each type received, with the etag it was rendered for
+chart_cache = {}
+
+CHART_TYPES = {
+    "1": "income_expense",
+    "2": "monthly_trend",
+    "3": "category_breakdown",
+    "4": "running_balance",
+}
+
+# Asks the user which chart to generate
+def choose_chart():
+    print("1) Income vs expenses")
+    print("2) Monthly income and expenses")
+    print("3) Expenses by category")
+    print("4) Running balance")
+    choice = input("Choose a chart [1-4]: ").strip()
+    return CHART_TYPES.get(choice, "income_expense")
+
 # MicroserviceC - creates a graph of transactions
-def create_graph_microserviceC():
-    context = zmq.Context()
-    socket = context.socket(zmq.REQ)
-    socket.connect("tcp://localhost:5554")
+@profiling.profiled
+def create_graph_microserviceC(chart="income_expense"):
+    # Send the etag we hold; the image is only resent if it changed
+    cached = chart_cache.get(chart, {})
+    try:
+        status, etag, data = get_repository().chart(chart, cached.get("etag"))
+    except ValueError as e:
+        print(e)
+        return
+    except zmq_client.ServiceUnavailable as e:
+        print(e)
+        return
 
-    # Send chart request
-    socket.send_string("generate_chart")
+    if status == "not_modified":
+        data = cached["image"]
+    elif status == "ok":
+        chart_cache[chart] = {"etag": etag, "image": data}
 
-    # Receive binary image data
-    data = socket.recv()
-    
     # Check if it's a string error instead
     if data.startswith(b"Error") or data.startswith(b"No data"):
         print(data.decode())
@@ -653,108 +848,220 @@ def create_graph_microserviceC():
     image = Image.open(io.BytesIO(data))
     image.show()  # Opens the image
 
+# Runs a savings query on the storage backend, or prints why it failed and returns None
+def call_microserviceD(query, *args):
+    try:
+        return query(*args)
+    except ValueError as e:
+        print(f"Failed: {e}")
+    except zmq_client.ServiceUnavailable as e:
+        print(e)
+    return None
+
 # MicroserviceD - view total savings and display in a table format
+@profiling.profiled
 def view_savings():
-    context = zmq.Context()
-    socket = context.socket(zmq.REQ)
-    socket.connect("tcp://localhost:5552")
+    """
+    Shows savings totals, savings per month and a paged list of savings entries.
+    """
+    repo = get_repository()
+    start = input("Enter start date (YYYY-MM-DD) (leave blank for all): ").strip() or None
+    end = input("Enter end date (YYYY-MM-DD) (leave blank for all): ").strip() or None
+
+    totals = call_microserviceD(repo.savings_totals, start, end)
+    months = call_microserviceD(repo.savings_by_month, start, end)
+    if totals is None or months is None:
+        input("Press Enter to return to the main menu...")
+        return
+
+    after = None
+    while True:
+        page = call_microserviceD(repo.savings_entries, start, end, after)
+        if page is None:
+            break
+        entries, after = page
 
-    socket.send_string("get_total_savings")
-    reply = socket.recv_string()
+        clear_screen()
+        print("--- Savings by Month ---")
+        print(tabulate.tabulate(
+            [[m["month"], m["count"], f"${m['total']:,.2f}"] for m in months],
+            headers=["Month", "Entries", "Amount (USD)"], tablefmt="fancy_grid"
+        ))
+        print("\n--- Savings Entries ---")
+        print(tabulate.tabulate(
+            [[e["date"], f"${e['amount']:,.2f}"] for e in entries],
+            headers=["Date", "Amount (USD)"], tablefmt="fancy_grid", colalign=("left", "right")
+        ))
+        print(f"Total Savings: ${totals['total']:,.2f} ({totals['count']} entries)")
+
+        if after is None:
+            input("Press Enter to return to the main menu...")
+            break
+        if input("Type 'n' for the next page or press Enter to return to the main menu: ").strip().lower() != 'n':
+            break
 
-    print(reply)
+# Prints how long the menu took to become ready and what was deferred, then exits
+def measure_startup():
+    """
+    The menu is drawn into a buffer at the point main() would show it; the
+    deferred imports and the database connection are then timed separately.
+    """
+    buffer = io.StringIO()
+    stdout, sys.stdout = sys.stdout, buffer
+    try:
+        title()
+        main_menu()
+    finally:
+        sys.stdout = stdout
+    menu_ready = time.perf_counter() - STARTED
+
+    connect_started = time.perf_counter()
+    connection = None
+    if db_connection.storage_backend() == "mongo":
+        connection = db_connection.connect_in_background()
+
+    timings = []
+    for name, module in LAZY_MODULES.items():
+        started = time.perf_counter()
+        dir(module)  # Any attribute access finishes a lazy import
+        timings.append((name, time.perf_counter() - started))
+
+    if connection is not None:
+        connection.join(timeout=30)
+    connected = time.perf_counter() - connect_started
+
+    print(f"Menu ready after {menu_ready * 1000:.1f} ms")
+    print(f"Deferred imports, loaded on first use: {sum(t for _, t in timings) * 1000:.1f} ms")
+    for name, seconds in sorted(timings, key=lambda item: -item[1]):
+        print(f"  {name:20} {seconds * 1000:8.1f} ms")
+    if connection is None:
+        print(f"Storage: {db_connection.storage_backend()} (no MongoDB connection needed)")
+        return
+    if connection.is_alive():
+        status = "still connecting"
+    else:
+        status = "failed" if connection.error else "connected"
+    print(f"MongoDB connection (in the background): {connected * 1000:.1f} ms, {status}")
 
 # This is the main program loop that will run until the user chooses to exit.
-while True:
-    clear_screen()
-    choice = 0
-    title()
-    main_menu()
-    choice = input("\nEnter a number between 1 and 5: ")
+def main():
+    if db_connection.storage_backend() == "mongo":
+        db_connection.connect_in_background()
+    while True:
+        clear_screen()
+        choice = 0
+        title()
+        main_menu()
+        choice = input("\nEnter a number between 1 and 5: ")
  
-    if choice == '1':
-        while True:
-            clear_screen()
-            view_transactions()
-            transaction_management_menu()
-
-            choice = input("Enter a number between 1 and 7: ")
-            if choice == '1':
-                print("--Add Transaction--")
-                add_transaction()
-            elif choice == '2':
-                print("--Delete Transaction--")
-                delete_transaction()
-            elif choice == '3':
-                print("--Edit Transactions--")
-                edit_transactions()
-            elif choice == '4':
-                export_transactions()
-            elif choice == '5':
-                print("Generating graph...")
-                time.sleep(1)
-                create_graph_microserviceC()
-            elif choice == '6':
-                print("Updating recurring transactions...")
-                apply_recurring_transactions()
-                time.sleep(2)
+        if choice == '1':
+            while True:
                 clear_screen()
-            elif choice == '7':
-                break
-            else:
-                print("Invalid choice, choose a number between 1-7.")
-    elif choice == '2':
-        clear_screen()
-        print("---Budget Overview---")
-        while True:
-            choice = input("Do you want to view your transactions or exit to the main menu (y/n/exit)? ").lower()
-            if choice == 'y':
-                view_transactions_by_type()
-            elif choice == 'n':
-                view_budget()
-                choice = input("Do you want to view a graph of your income vs expenses? (y/n/exit): ").lower()
-                if choice == 'y':
-                    print("Generating chart...")
-                    create_graph_microserviceC()
-                else:
-                    print("Returning to main menu...")
+                view_transactions()
+                transaction_management_menu()
+
+                choice = input("Enter a number between 1 and 8: ")
+                if page_transactions(choice.lower()):
+                    continue
+                if choice == '1':
+                    print("--Add Transaction--")
+                    add_transaction()
+                elif choice == '2':
+                    print("--Delete Transaction--")
+                    delete_transaction()
+                elif choice == '3':
+                    print("--Edit Transactions--")
+                    edit_transactions()
+                elif choice == '4':
+                    export_transactions()
+                elif choice == '5':
+                    chart = choose_chart()
+                    print("Generating graph...")
+                    create_graph_microserviceC(chart)
+                elif choice == '6':
+                    print("Updating recurring transactions...")
+                    apply_recurring_transactions()
                     time.sleep(2)
                     clear_screen()
-            elif choice == 'exit':
-                break
-            else:
-                print("Invalid choice, please type 'y', 'n', or 'exit'.")
-        view_budget()
-    elif choice == '3':
-        while True:
+                elif choice == '7':
+                    print("--Bulk Delete Transactions--")
+                    bulk_delete_transactions()
+                elif choice == '8':
+                    break
+                else:
+                    print("Invalid choice, choose a number between 1-8.")
+        elif choice == '2':
             clear_screen()
-            view_budget_goals()
-            budget_goals_menu()
-            choice = input("Enter a number between 1 and 4: ")
-            if choice == '1':
-                print("--Create a new budget goal--")
-                create_budget_goal()
-            elif choice == '2':
-                print("--Update a budget goal--")
-                update_budget_goal()
-            elif choice == '3':
-                print("--Delete a budget goal--")
-                delete_budget_goal()
-            elif choice == '4':
-                break
-            else:
-                print("Invalid choice, choose a number between 1-5.")
-        print("Budget Goals")
-    elif choice == '4':
-        clear_screen()
-        view_savings()
-        input("Press Enter to return to the main menu...")
-        clear_screen()
-    elif choice == '5':
-        print("Exiting, goodbye!")
-        time.sleep(2)
-        clear_screen()
-        break
-    else:
-        print("Invalid choice, please select a number between 1-4.")
-        time.sleep(2)
+            print("---Budget Overview---")
+            while True:
+                choice = input("Do you want to view your transactions, a spending report or exit to the main menu (y/n/r/exit)? ").lower()
+                if choice == 'y':
+                    view_transactions_by_type()
+                elif choice == 'r':
+                    view_spending_report()
+                elif choice == 'n':
+                    view_budget()
+                    choice = input("Do you want to view a graph of your income vs expenses? (y/n/exit): ").lower()
+                    if choice == 'y':
+                        print("Generating chart...")
+                        create_graph_microserviceC()
+                    else:
+                        print("Returning to main menu...")
+                        time.sleep(2)
+                        clear_screen()
+                elif choice == 'exit':
+                    break
+                else:
+                    print("Invalid choice, please type 'y', 'n', 'r', or 'exit'.")
+            view_budget()
+        elif choice == '3':
+            while True:
+                clear_screen()
+                view_budget_goals()
+                budget_goals_menu()
+                choice = input("Enter a number between 1 and 5: ")
+                if choice == '1':
+                    print("--Create a new budget goal--")
+                    create_budget_goal()
+                elif choice == '2':
+                    print("--Update a budget goal--")
+                    update_budget_goal()
+                elif choice == '3':
+                    print("--Delete a budget goal--")
+                    delete_budget_goal()
+                elif choice == '4':
+                    print("--Bulk delete budget goals--")
+                    bulk_delete_budget_goals()
+                elif choice == '5':
+                    break
+                else:
+                    print("Invalid choice, choose a number between 1-5.")
+            print("Budget Goals")
+        elif choice == '4':
+            clear_screen()
+            view_savings()
+            clear_screen()
+        elif choice == '5':
+            print("Exiting, goodbye!")
+            time.sleep(2)
+            clear_screen()
+            break
+        else:
+            print("Invalid choice, please select a number between 1-4.")
+            time.sleep(2)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="BudgetWise personal budget app")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="profile every menu action into DIR (see profiling.py)")
+    parser.add_argument("--startup-time", action="store_true",
+                        help="print how long startup takes and what is deferred, then exit")
+    args = parser.parse_args()
+    if args.startup_time:
+        measure_startup()
+        sys.exit()
+    if args.profile:
+        profiling.enable(args.profile)
+    main()
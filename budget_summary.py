@@ -0,0 +1,72 @@
+"""
+Budget summary engine
+
+Builds the $group pipelines that compute income, expense and net totals on
+the MongoDB server, so only a handful of result documents cross the network no
+matter how large the transactions collection gets. rollups.py runs them to
+build and repair the rollups that every report reads.
+
+Totals follow the same rule as the budget overview: positive amounts count as
+income and negative amounts count as expenses.
+"""
+from datetime import datetime
+
+# Fields a summary can be split by, mapped to the expression that computes them
+GROUP_FIELDS = {
+    "month": {"$substr": ["$date", 0, 7]},
+    "type": "$type",
+    "category": "$category",
+}
+
+# Returns the [start, end) date string range covering a "YYYY-MM" month
+def month_range(month):
+    """
+    Dates are stored as "YYYY-MM-DD" strings, so a month is every date that
+    sorts between "YYYY-MM" and the next month's "YYYY-MM".
+    """
+    start = datetime.strptime(month, "%Y-%m")
+    if start.month == 12:
+        end = start.replace(year=start.year + 1, month=1)
+    else:
+        end = start.replace(month=start.month + 1)
+    return start.strftime("%Y-%m"), end.strftime("%Y-%m")
+
+# Builds the aggregation pipeline for the requested grouping
+def build_summary_pipeline(group_by=(), match=None):
+    """
+    Returns a $group pipeline that totals income, expenses and net amount.
+    group_by is any combination of "month", "type" and "category".
+    """
+    unknown = [field for field in group_by if field not in GROUP_FIELDS]
+    if unknown:
+        raise ValueError(f"Cannot group by: {', '.join(unknown)}")
+
+    if group_by:
+        group_id = {field: GROUP_FIELDS[field] for field in group_by}
+    else:
+        group_id = None
+
+    pipeline = []
+    if match:
+        pipeline.append({"$match": match})
+    pipeline.append({
+        "$group": {
+            "_id": group_id,
+            "income": {"$sum": {"$cond": [{"$gte": ["$amount", 0]}, "$amount", 0]}},
+            "expenses": {"$sum": {"$cond": [{"$lt": ["$amount", 0]}, "$amount", 0]}},
+            "count": {"$sum": 1},
+        }
+    })
+    pipeline.append({
+        "$project": {
+            "_id": 0,
+            "group": "$_id",
+            "income": 1,
+            "expenses": 1,
+            "net": {"$add": ["$income", "$expenses"]},
+            "count": 1,
+        }
+    })
+    if group_by:
+        pipeline.append({"$sort": {f"group.{field}": 1 for field in group_by}})
+    return pipeline
@@ -1,7 +1,5 @@
-
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
 import os
+import threading
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -9,18 +7,45 @@ load_dotenv()
 
 # Retrieve the MongoDB connection string from environment variables
 uri = os.getenv("MONGODB_URI")
-if uri is None:
-    raise ValueError("MONGODB_URI is not valid.")
 
-# Create a new client and connect to the server
-client = MongoClient(uri, server_api=ServerApi('1'))
+# The client is created on first use so importing this module stays fast
+client = None
+_client_lock = threading.Lock()
+
+# Returns the shared MongoClient, creating it the first time
+def get_client():
+    global client
+    with _client_lock:
+        if client is None:
+            if uri is None:
+                raise ValueError("MONGODB_URI is not valid.")
+            from pymongo.mongo_client import MongoClient
+            from pymongo.server_api import ServerApi
+            client = MongoClient(uri, server_api=ServerApi('1'))
+    return client
 
-# Send a ping to confirm a successful connection
-try:
-    client.admin.command('ping')
-    print("Pinged your deployment. You successfully connected to MongoDB!")
-except Exception as e:
-    print(e)
+# Creates the client and pings the deployment on a background thread
+def connect_in_background():
+    """
+    Returns the thread so callers can wait for the connection if they need to;
+    its error attribute holds the exception if the ping failed. Only a failed
+    ping is reported, so the menu is not interrupted.
+    """
+    def connect():
+        try:
+            get_client().admin.command('ping')
+        except Exception as e:
+            thread.error = e
+            print(f"\nCould not connect to MongoDB: {e}")
+
+    thread = threading.Thread(target=connect, daemon=True)
+    thread.error = None
+    thread.start()
+    return thread
 
 def get_db():
-    return client["budgetwise_db"]
\ No newline at end of file
+    return get_client()["budgetwise_db"]
+
+# Returns the storage backend picked by BUDGETWISE_STORAGE: "mongo" (default) or "sqlite"
+def storage_backend():
+    return os.getenv("BUDGETWISE_STORAGE", "mongo").lower()
@@ -0,0 +1,142 @@
+"""
+Budget goal progress
+
+A budget goal can track part of the ledger: a category, a type and/or a date
+window (date_from / date_to, inclusive "YYYY-MM-DD"). Tracked goals have
+"tracked": True and a "direction" of 1 to count money received or -1 to count
+money spent. Their current_amount is kept up to date like the rollups: every
+write to the transactions collection applies an $inc delta to the goals the
+transaction falls in, so showing progress never scans the ledger.
+
+Run `python goal_progress.py recompute` to recompute every tracked goal from
+the ledger, e.g. to backfill goals or fix drift.
+"""
+import sys
+from pymongo import UpdateMany, UpdateOne
+
+GOAL_COLLECTION = "budget_goals"
+TRACK_FIELDS = ("tracked", "direction", "category", "type", "date_from", "date_to")
+
+# Builds the query for the tracked goals a transaction counts towards
+def goals_matching(transaction, direction):
+    """
+    A goal matches when each of its category/type/date bounds is unset or
+    satisfied by the transaction.
+    """
+    date = str(transaction.get("date", ""))
+    return {
+        "tracked": True,
+        "direction": direction,
+        "category": {"$in": [transaction.get("category"), None]},
+        "type": {"$in": [transaction.get("type"), None]},
+        "$and": [
+            {"$or": [{"date_from": None}, {"date_from": {"$lte": date}}]},
+            {"$or": [{"date_to": None}, {"date_to": {"$gte": date}}]},
+        ],
+    }
+
+# Builds the transaction query covering everything a goal tracks
+def progress_match(goal):
+    match = {}
+    for field in ("category", "type"):
+        if goal.get(field) is not None:
+            match[field] = goal[field]
+    if goal.get("date_from") or goal.get("date_to"):
+        match["date"] = {}
+        if goal.get("date_from"):
+            match["date"]["$gte"] = goal["date_from"]
+        if goal.get("date_to"):
+            match["date"]["$lte"] = goal["date_to"]
+    return match
+
+# Sends the goal deltas for (date, type, category) amounts in one round trip
+def apply_amounts(db, amounts):
+    requests = []
+    for (date, txn_type, category), amount in amounts.items():
+        if not amount:
+            continue
+        transaction = {"date": date, "type": txn_type, "category": category}
+        for direction in (1, -1):
+            requests.append(UpdateMany(
+                goals_matching(transaction, direction), {"$inc": {"current_amount": direction * amount}}
+            ))
+    if requests:
+        db[GOAL_COLLECTION].bulk_write(requests, ordered=False)
+
+# Adds the deltas of one or more transactions to the goals they count towards
+def apply_transactions(db, transactions, sign=1):
+    """
+    Use sign=1 for inserted transactions and sign=-1 for deleted ones.
+    Transactions sharing a date, type and category are sent as one delta.
+    """
+    amounts = {}
+    for transaction in transactions:
+        key = (str(transaction.get("date", "")), transaction.get("type"), transaction.get("category"))
+        amounts[key] = amounts.get(key, 0) + sign * (transaction.get("amount", 0) or 0)
+    apply_amounts(db, amounts)
+
+# Applies the goal delta for a single inserted or deleted transaction
+def apply_transaction(db, transaction, sign=1):
+    apply_transactions(db, [transaction], sign)
+
+# Moves a transaction's contribution from its old values to its new values
+def apply_update(db, old_transaction, new_transaction):
+    amounts = {}
+    for transaction, sign in ((old_transaction, -1), (new_transaction, 1)):
+        key = (str(transaction.get("date", "")), transaction.get("type"), transaction.get("category"))
+        amounts[key] = amounts.get(key, 0) + sign * (transaction.get("amount", 0) or 0)
+    apply_amounts(db, amounts)
+
+# Applies the goal deltas for every transaction matching a filter
+def apply_matching(db, match, sign=1):
+    """
+    Sums the matching transactions per (date, type, category) with one
+    aggregation, e.g. right before a delete_many with the same filter. Skipped
+    when no goal is tracked.
+    """
+    if db[GOAL_COLLECTION].find_one({"tracked": True}, {"_id": 1}) is None:
+        return
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"date": "$date", "type": "$type", "category": "$category"},
+            "amount": {"$sum": "$amount"},
+        }},
+    ]
+    amounts = {}
+    for row in db.transactions.aggregate(pipeline):
+        key = (str(row["_id"].get("date", "")), row["_id"].get("type"), row["_id"].get("category"))
+        amounts[key] = amounts.get(key, 0) + sign * row["amount"]
+    apply_amounts(db, amounts)
+
+# Recomputes tracked goals from the ledger
+def recompute_goals(db, goal_ids=None):
+    """
+    Recomputes every tracked goal, or only the given goal _ids.
+    Returns the number of goals written.
+    """
+    query = {"tracked": True}
+    if goal_ids is not None:
+        query["_id"] = {"$in": list(goal_ids)}
+    requests = []
+    for goal in db[GOAL_COLLECTION].find(query):
+        pipeline = [{"$match": progress_match(goal)}, {"$group": {"_id": None, "amount": {"$sum": "$amount"}}}]
+        rows = list(db.transactions.aggregate(pipeline))
+        total = rows[0]["amount"] if rows else 0
+        requests.append(UpdateOne(
+            {"_id": goal["_id"]}, {"$set": {"current_amount": goal.get("direction", 1) * total}}
+        ))
+    if requests:
+        db[GOAL_COLLECTION].bulk_write(requests, ordered=False)
+    return len(requests)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] != "recompute":
+        print("Usage: python goal_progress.py recompute")
+        sys.exit(1)
+
+    import storage
+
+    written = storage.get_repository().recompute_goal_progress()
+    print(f"Recomputed {written} tracked goal(s).")
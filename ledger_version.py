@@ -0,0 +1,24 @@
+"""
+Ledger version counter
+
+A per-collection counter in the "collection_versions" collection that is bumped
+on every write to the transactions collection. Services that cache query
+results compare it with the version their cached entry was built from, which
+costs one _id lookup instead of re-running the query.
+
+The "transaction_deletes" counter holds how many transactions were deleted.
+Deletes leave nothing behind to fetch, so caches that pick up changes by
+timestamp compare it to notice deletes made by other writers.
+"""
+
+VERSION_COLLECTION = "collection_versions"
+DELETES_COUNTER = "transaction_deletes"
+
+# Records that a collection changed (or adds to a counter such as DELETES_COUNTER)
+def bump_version(db, name="transactions", amount=1):
+    db[VERSION_COLLECTION].update_one({"_id": name}, {"$inc": {"version": amount}}, upsert=True)
+
+# Returns the current version of a collection (0 if it was never bumped)
+def get_version(db, name="transactions"):
+    doc = db[VERSION_COLLECTION].find_one({"_id": name})
+    return doc["version"] if doc else 0
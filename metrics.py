@@ -0,0 +1,259 @@
+"""
+Service metrics
+
+Shared instrumentation for the microservices. Each service keeps one
+ServiceMetrics that records, per command:
+  - a latency histogram
+  - request and reply payload sizes
+  - error counts
+and, through MongoCommandTimer (a pymongo CommandListener passed to
+MongoClient), how long every MongoDB command took per collection.
+
+snapshot() is the reply to a {"command": "stats"} request. Set
+METRICS_PROMETHEUS_DIR to also write the metrics in Prometheus text format to
+<dir>/<service>.prom every METRICS_DUMP_SECONDS (default 15), e.g. for the
+node exporter's textfile collector.
+
+setup_logging() configures leveled logging for a service; BUDGETWISE_LOG_LEVEL
+picks the level (default INFO, DEBUG shows every request).
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+
+from pymongo import monitoring
+
+# Latency bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Payload size bucket upper bounds in bytes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+DUMP_SECONDS = float(os.getenv("METRICS_DUMP_SECONDS", "15"))
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram; the last count holds values above every bucket.
+    Not thread-safe on its own, ServiceMetrics guards it.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    # Upper bound of the bucket holding the q-th quantile (None above the last bucket)
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    # Returns [(le, cumulative count), ...] ending with "+Inf"
+    def cumulative(self):
+        rows = []
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            rows.append((repr(bound), seen))
+        rows.append(("+Inf", self.count))
+        return rows
+
+
+class CommandStats:
+    """
+    Everything recorded for one command.
+    """
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.reply_bytes = Histogram(SIZE_BUCKETS)
+        self.request_bytes = 0
+        self.errors = 0
+
+    # Summary sent back by the stats command; percentiles are bucket upper bounds
+    def summary(self):
+        count = self.latency.count
+
+        def ms(seconds):
+            return None if seconds is None else seconds * 1000
+
+        return {
+            "count": count,
+            "errors": self.errors,
+            "mean_ms": round(self.latency.sum / count * 1000, 3) if count else 0.0,
+            "p50_ms": ms(self.latency.quantile(0.5)),
+            "p95_ms": ms(self.latency.quantile(0.95)),
+            "p99_ms": ms(self.latency.quantile(0.99)),
+            "request_bytes": self.request_bytes,
+            "reply_bytes": int(self.reply_bytes.sum),
+        }
+
+
+class ServiceMetrics:
+    """
+    Thread-safe per-command and per-Mongo-command statistics for one service.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._commands = {}
+        self._mongo = {}
+
+    # Records one answered request
+    def observe(self, command, seconds, request_bytes=0, reply_bytes=0):
+        with self._lock:
+            stats = self._commands.setdefault(command, CommandStats())
+            stats.latency.observe(seconds)
+            stats.reply_bytes.observe(reply_bytes)
+            stats.request_bytes += request_bytes
+
+    # Counts a request that failed or was answered with an error
+    def error(self, command):
+        with self._lock:
+            self._commands.setdefault(command, CommandStats()).errors += 1
+
+    # Records one MongoDB command
+    def observe_mongo(self, command, collection, seconds, failed=False):
+        with self._lock:
+            stats = self._mongo.setdefault((command, collection), CommandStats())
+            stats.latency.observe(seconds)
+            if failed:
+                stats.errors += 1
+
+    # Returns the stats reply
+    def snapshot(self):
+        with self._lock:
+            return {
+                "service": self.service,
+                "uptime_seconds": round(time.time() - self.started_at, 1),
+                "commands": {name: s.summary() for name, s in sorted(self._commands.items())},
+                "mongo": {
+                    f"{command} {collection}": {
+                        k: v for k, v in s.summary().items() if k not in ("request_bytes", "reply_bytes")
+                    }
+                    for (command, collection), s in sorted(self._mongo.items())
+                },
+            }
+
+    # Returns the metrics in Prometheus text exposition format
+    def prometheus_text(self):
+        lines = []
+
+        def histogram(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in series:
+                for le, count in hist.cumulative():
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {hist.sum}")
+                lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+        def counter(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series:
+                lines.append(f"{name}{{{labels}}} {value}")
+
+        with self._lock:
+            commands = [(f'service="{self.service}",command="{name}"', s) for name, s in sorted(self._commands.items())]
+            mongo = [
+                (f'service="{self.service}",command="{command}",collection="{collection}"', s)
+                for (command, collection), s in sorted(self._mongo.items())
+            ]
+            histogram("budgetwise_request_duration_seconds", "Time to answer a request.",
+                      [(labels, s.latency) for labels, s in commands])
+            histogram("budgetwise_reply_bytes", "Size of the reply payload.",
+                      [(labels, s.reply_bytes) for labels, s in commands])
+            counter("budgetwise_request_bytes_total", "Bytes received in requests.",
+                    [(labels, s.request_bytes) for labels, s in commands])
+            counter("budgetwise_request_errors_total", "Requests that failed or returned an error.",
+                    [(labels, s.errors) for labels, s in commands])
+            histogram("budgetwise_mongo_command_duration_seconds", "Time spent in MongoDB commands.",
+                      [(labels, s.latency) for labels, s in mongo])
+            counter("budgetwise_mongo_command_errors_total", "MongoDB commands that failed.",
+                    [(labels, s.errors) for labels, s in mongo])
+        return "\n".join(lines) + "\n"
+
+    # Writes the Prometheus text to a file, replacing it atomically
+    def write_prometheus(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    # Starts a background thread that rewrites <dir>/<service>.prom, when METRICS_PROMETHEUS_DIR is set
+    def start_prometheus_dump(self, directory=None, interval=DUMP_SECONDS):
+        directory = directory or os.getenv("METRICS_PROMETHEUS_DIR")
+        if not directory:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.service}.prom")
+        log = logging.getLogger(self.service)
+
+        def dump():
+            while True:
+                try:
+                    self.write_prometheus(path)
+                except OSError as e:
+                    log.warning("Could not write metrics to %s: %s", path, e)
+                time.sleep(interval)
+
+        thread = threading.Thread(target=dump, daemon=True)
+        thread.start()
+        log.info("Writing Prometheus metrics to %s every %ss", path, interval)
+        return path
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """
+    pymongo command listener that feeds MongoDB timings into a ServiceMetrics.
+    Pass it to MongoClient(event_listeners=[...]).
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    # Remembers which collection a command targets, the later events do not carry it
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = (
+                collection if isinstance(collection, str) else event.database_name
+            )
+
+    def _finish(self, event, failed):
+        with self._lock:
+            collection = self._collections.pop((event.connection_id, event.request_id), "")
+        self.metrics.observe_mongo(event.command_name, collection, event.duration_micros / 1e6, failed)
+
+    def succeeded(self, event):
+        self._finish(event, False)
+
+    def failed(self, event):
+        self._finish(event, True)
+
+
+# Configures leveled logging for a service process
+def setup_logging():
+    logging.basicConfig(
+        level=os.getenv("BUDGETWISE_LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(name)s %(levelname)s %(message)s",
+    )
@@ -1,100 +1,357 @@
 #!/usr/bin/env python3
 """
-Microservice A: Transaction Filtering 
+Microservice A: Transaction Filtering
+
+Listens on ZeroMQ ROUTER at tcp://0.0.0.0:5555 and hands requests to a pool of
+worker threads over an inproc DEALER socket, so a slow query only holds up
+its own worker. All workers share one MongoClient. Set MICROSERVICE_A_WORKERS
+to change the pool size (default 4). Clients still talk to it with plain REQ
+sockets.
 
-Listens on ZeroMQ REP at tcp://0.0.0.0:5555.
 Accepts JSON requests to:
   - Filter by month ("YYYY-MM")
+  - Filter by date range ("from"/"to" as "YYYY-MM-DD", both inclusive)
+  - Filter by amount range ("min_amount"/"max_amount")
   - Filter by type ("income"/"expense")
   - Lookup by transaction ID
+Month, date, amount and type filters can be combined and are served by the
+indexes created at startup.
 Responds with JSON: either a list of transactions or a single transaction object.
+
+Serialized responses are kept in an LRU+TTL cache keyed by the normalized
+request. Entries are tagged with the ledger version counter, which every
+transaction write bumps, so a write invalidates everything cached before it.
+Send {"command": "stats"} to see the cache hit/miss counts and the request
+and MongoDB latency metrics (see metrics.py).
+
+Clients that send an "accept" field (see wire.py) get a compact two-frame
+reply: msgpack or JSON, transaction lists as columns, and compression for
+large payloads. Adding "chunk_size" splits a filter result into chunks ordered
+by (date, _id), which the (date, _id) index serves; the reply header's "next"
+token ({"date", "id"} of the last row) is sent back as "after" to fetch the
+following chunk, so the client can show the first rows straight away.
+
+Several queries can be sent in one round trip as {"batch": [query, ...]}. Each
+query is an id lookup, a filter, {"totals": true} (income/expense/net totals) or
+{"recent": n} (the n newest transactions). The queries run concurrently and the
+reply is {"results": [{"result": ..., "next": ...}, ...]} in request order.
 """
 import os
 import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import zmq
+from datetime import datetime
+from bson.errors import InvalidId
 from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
+import rollups
+from budget_summary import month_range
+from ledger_version import get_version
+from response_cache import ResponseCache
+from metrics import MongoCommandTimer, ServiceMetrics, setup_logging
+import wire
 from dotenv import load_dotenv
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 import certifi
 
-# Load .env
-load_dotenv()
-MONGO_URI = os.getenv("MONGODB_URI")
-if not MONGO_URI:
-    raise ValueError("MONGODB_URI not set in .env")
-
-# MongoDB client with TLS
-client = MongoClient(
-    MONGO_URI,
-    server_api=ServerApi("1"),
-    tls=True,
-    tlsCAFile=certifi.where(),
-    serverSelectionTimeoutMS=5000,
+ZMQ_ADDR = "tcp://0.0.0.0:5555"
+WORKERS_ADDR = "inproc://microserviceA-workers"
+WORKER_COUNT = int(os.getenv("MICROSERVICE_A_WORKERS", "4"))
+
+PROJECTION = {"date": 1, "type": 1, "description": 1, "category": 1, "amount": 1}
+FIELDS = ["_id", "date", "type", "description", "category", "amount"]
+MAX_CHUNK_SIZE = 5000
+MAX_BATCH_SIZE = 20
+MAX_RECENT = 200
+
+log = logging.getLogger("microserviceA")
+metrics = ServiceMetrics("microserviceA")
+
+# Threads that run the queries of a batch request concurrently
+batch_pool = ThreadPoolExecutor(max_workers=int(os.getenv("MICROSERVICE_A_BATCH_THREADS", "8")))
+
+# Cache of serialized filter responses shared by every worker
+cache = ResponseCache(
+    max_entries=int(os.getenv("MICROSERVICE_A_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.getenv("MICROSERVICE_A_CACHE_TTL", "60")),
 )
-try:
-    client.admin.command("ping")
-    print("Connected to MongoDB")
-except Exception as e:
-    print("MongoDB ping failed:", e)
-    exit(1)
 
-db = client["budgetwise_db"]
-transactions = db.transactions
+# Connects to MongoDB and returns the transactions collection
+def connect():
+    load_dotenv()
+    mongo_uri = os.getenv("MONGODB_URI")
+    if not mongo_uri:
+        raise ValueError("MONGODB_URI not set in .env")
 
-# ZeroMQ setup
-ZMQ_ADDR = "tcp://0.0.0.0:5555"
-ctx = zmq.Context()
-socket = ctx.socket(zmq.REP)
-socket.bind(ZMQ_ADDR)
-print(f"Microservice A Listening on {ZMQ_ADDR}...")
+    # MongoDB client with TLS, shared by every worker thread
+    client = MongoClient(
+        mongo_uri,
+        server_api=ServerApi("1"),
+        tls=True,
+        tlsCAFile=certifi.where(),
+        serverSelectionTimeoutMS=5000,
+        maxPoolSize=max(WORKER_COUNT, 10),
+        event_listeners=[MongoCommandTimer(metrics)],
+    )
+    try:
+        client.admin.command("ping")
+        log.info("Connected to MongoDB")
+    except Exception as e:
+        log.error("MongoDB ping failed: %s", e)
+        exit(1)
+
+    return client["budgetwise_db"].transactions
+
+# Creates the indexes backing the date, type, amount and recent queries
+def create_indexes(transactions):
+    transactions.create_index([("date", ASCENDING)])
+    transactions.create_index([("type", ASCENDING), ("date", ASCENDING)])
+    transactions.create_index([("amount", ASCENDING)])
+    transactions.create_index([("date", DESCENDING), ("_id", DESCENDING)])
+
+# Builds the MongoDB range query for a month/date/amount/type filter request
+def build_query(req):
+    """
+    Dates are stored as "YYYY-MM-DD" strings, so lexical range comparisons
+    match calendar order and can use the date indexes.
+    """
+    query = {}
+    date_range = {}
+    if "month" in req:
+        start, end = month_range(req["month"])
+        date_range["$gte"] = start
+        date_range["$lt"] = end
+    if "from" in req:
+        datetime.strptime(req["from"], "%Y-%m-%d")
+        date_range["$gte"] = max(date_range.get("$gte", req["from"]), req["from"])
+    if "to" in req:
+        datetime.strptime(req["to"], "%Y-%m-%d")
+        date_range["$lte"] = req["to"]
+    if date_range:
+        query["date"] = date_range
+
+    amount_range = {}
+    if "min_amount" in req:
+        amount_range["$gte"] = float(req["min_amount"])
+    if "max_amount" in req:
+        amount_range["$lte"] = float(req["max_amount"])
+    if amount_range:
+        query["amount"] = amount_range
+
+    if "type" in req:
+        query["type"] = req["type"]
+    return query
+
+# Answers one request and returns (response, next chunk token)
+def handle_request(req, transactions):
+    """
+    The response is JSON-serializable. The token is only set when the request
+    asked for a chunk_size and more results remain.
+    """
+    if "filter" in req:
+        log.debug("Received a request from the client: %s", req["filter"])
+        return {"status": "Server received your message!"}, None
+
+    if "batch" in req:
+        return handle_batch(req["batch"], transactions), None
+
+    # Income/expense/net totals, read from the rollups
+    if req.get("totals"):
+        return rollups.rollup_totals(transactions.database), None
 
-while True:
+    # Newest transactions first
+    if "recent" in req:
+        limit = max(1, min(int(req["recent"]), MAX_RECENT))
+        docs = list(
+            transactions.find({}, PROJECTION)
+            .sort([("date", DESCENDING), ("_id", DESCENDING)])
+            .limit(limit)
+        )
+        for d in docs:
+            d["_id"] = str(d["_id"])
+        return docs, None
+
+    # ID lookup
+    if "id" in req:
+        try:
+            oid = ObjectId(req["id"])
+            doc = transactions.find_one({"_id": oid}, PROJECTION)
+            if doc:
+                doc["_id"] = str(doc["_id"])
+                return doc, None
+            return {"error": "Transaction not found"}, None
+        except Exception as exc:
+            return {"error": f"Invalid id: {exc}"}, None
+
+    # Month/date/amount/type filter (any combination)
     try:
-        req = socket.recv_json()
-
-        if "filter" in req:
-            print(f"[Server] Received a request from the client: {req['filter']}")
-            socket.send_json({"status": "Server received your message!"})
-            continue
-    
-        # ID lookup
-        if "id" in req:
+        query = build_query(req)
+    except ValueError as exc:
+        return {"error": f"Invalid filter: {exc}"}, None
+    if not query:
+        return {"error": "Provide 'id', 'month', 'from', 'to', 'min_amount', 'max_amount', or 'type'"}, None
+
+    if "chunk_size" not in req:
+        docs = []
+        for d in transactions.find(query, PROJECTION):
+            d["_id"] = str(d["_id"])
+            docs.append(d)
+        return docs, None
+
+    # Chunked: the next chunk starts after the (date, _id) of the last row of this one
+    chunk_size = max(1, min(int(req["chunk_size"]), MAX_CHUNK_SIZE))
+    after = req.get("after")
+    if after:
+        try:
+            after_date, after_id = str(after["date"]), ObjectId(after["id"])
+        except (TypeError, KeyError, InvalidId):
+            return {"error": "Invalid continuation token"}, None
+        query = {"$and": [query, {"$or": [
+            {"date": {"$gt": after_date}},
+            {"date": after_date, "_id": {"$gt": after_id}},
+        ]}]}
+    docs = list(
+        transactions.find(query, PROJECTION)
+        .sort([("date", ASCENDING), ("_id", ASCENDING)])
+        .limit(chunk_size + 1)
+    )
+    next_token = None
+    if len(docs) > chunk_size:
+        docs = docs[:chunk_size]
+        next_token = {"date": docs[-1]["date"], "id": str(docs[-1]["_id"])}
+    for d in docs:
+        d["_id"] = str(d["_id"])
+    return docs, next_token
+
+# Runs the queries of a batch request concurrently
+def handle_batch(queries, transactions):
+    if not isinstance(queries, list) or not queries:
+        return {"error": "'batch' must be a non-empty list of queries"}
+    if len(queries) > MAX_BATCH_SIZE:
+        return {"error": f"A batch can hold at most {MAX_BATCH_SIZE} queries"}
+
+    def run(query):
+        if not isinstance(query, dict) or "batch" in query:
+            return {"result": {"error": "Invalid query in batch"}, "next": None}
+        try:
+            resp, next_token = handle_request(query, transactions)
+        except Exception as e:
+            resp, next_token = {"error": f"Unexpected error: {e}"}, None
+        return {"result": resp, "next": next_token}
+
+    return {"results": list(batch_pool.map(run, queries))}
+
+# Serializes a response in the format the client asked for, returns the reply frames
+def reply_frames(req, resp, next_token=None):
+    if "accept" not in req:
+        return [json.dumps(resp).encode()]
+    encoding, compression = wire.negotiate(req["accept"])
+    if isinstance(resp, list):
+        header, payload = wire.encode(
+            wire.to_columns(resp, FIELDS), encoding, compression,
+            format="columns", count=len(resp), next=next_token,
+        )
+    else:
+        header, payload = wire.encode(resp, encoding, compression, format="object", next=None)
+    return [header, payload]
+
+# Builds the cache key for a request from its exact values
+def cache_key(req):
+    """
+    Strings are kept as sent because build_query matches them exactly. Only
+    the amounts are canonicalized, since build_query converts them to floats.
+    """
+    normalized = dict(req)
+    for field in ("min_amount", "max_amount"):
+        if field in normalized:
             try:
-                oid = ObjectId(req["id"])
-                doc = transactions.find_one(
-                    {"_id": oid},
-                    {"date":1, "type":1, "description":1, "category":1, "amount":1}
-                )
-                if doc:
-                    doc["_id"] = str(doc["_id"])
-                    resp = doc
-                else:
-                    resp = {"error": "Transaction not found"}
-            except Exception as exc:
-                resp = {"error": f"Invalid id: {exc}"}
+                normalized[field] = float(normalized[field])
+            except (TypeError, ValueError):
+                pass
+    return json.dumps(normalized, sort_keys=True)
+
+# Names a request for the metrics
+def command_name(req):
+    if not isinstance(req, dict):
+        return "invalid"
+    if "command" in req:
+        return str(req["command"])
+    for name in ("filter", "batch", "totals", "recent", "id"):
+        if name in req:
+            return name
+    return "chunked_query" if "chunk_size" in req else "query"
 
+# Returns the reply frames for a request, from the cache when it is current
+def respond(req, transactions):
+    if req.get("command") == "stats":
+        return reply_frames(req, {
+            "cache": cache.stats(),
+            "version": get_version(transactions.database),
+            "metrics": metrics.snapshot(),
+        })
+    if "filter" in req:
+        return reply_frames(req, *handle_request(req, transactions))
+
+    key = cache_key(req)
+    version = get_version(transactions.database)
+    reply = cache.get(key, version)
+    if reply is None:
+        resp, next_token = handle_request(req, transactions)
+        reply = reply_frames(req, resp, next_token)
+        if isinstance(resp, dict) and "error" in resp:
+            metrics.error(command_name(req))
         else:
-            # Month/type filter (either or both)
-            query = {}
-            if "month" in req:
-                query["date"] = {"$regex": f"^{req['month']}"}
-            if "type" in req:
-                query["type"] = req["type"]
-            if not query:
-                resp = {"error": "Provide 'id', 'month', or 'type'"}
-            else:
-                docs = []
-                for d in transactions.find(
-                        query,
-                        {"date":1, "type":1, "description":1, "category":1, "amount":1}
-                    ):
-                    d["_id"] = str(d["_id"])
-                    docs.append(d)
-                resp = docs
-
-        socket.send_json(resp)
+            cache.put(key, version, reply)
+    return reply
 
-    except Exception as e:
-        socket.send_json({"error": f"Unexpected error: {e}"})
-        continue
+# Worker thread: answers requests handed out by the broker
+def worker(ctx, transactions):
+    socket = ctx.socket(zmq.REP)
+    socket.connect(WORKERS_ADDR)
+
+    while True:
+        try:
+            message = socket.recv()
+        except zmq.ContextTerminated:
+            break
+
+        started = time.perf_counter()
+        command = "invalid"
+        try:
+            req = json.loads(message)
+            command = command_name(req)
+            log.debug("Request %s: %s", command, req)
+            reply = respond(req, transactions)
+        except Exception as e:
+            log.exception("Request failed")
+            metrics.error(command)
+            reply = [json.dumps({"error": f"Unexpected error: {e}"}).encode()]
+        socket.send_multipart(reply)
+        metrics.observe(command, time.perf_counter() - started, len(message), sum(len(f) for f in reply))
+
+def main():
+    setup_logging()
+    metrics.start_prometheus_dump()
+    transactions = connect()
+    create_indexes(transactions)
+
+    # ZeroMQ broker: clients connect to the ROUTER, workers to the DEALER
+    ctx = zmq.Context()
+    frontend = ctx.socket(zmq.ROUTER)
+    frontend.bind(ZMQ_ADDR)
+    backend = ctx.socket(zmq.DEALER)
+    backend.bind(WORKERS_ADDR)
+
+    for _ in range(WORKER_COUNT):
+        threading.Thread(target=worker, args=(ctx, transactions), daemon=True).start()
+
+    log.info("Microservice A listening on %s with %d workers", ZMQ_ADDR, WORKER_COUNT)
+    zmq.proxy(frontend, backend)
+
+
+if __name__ == "__main__":
+    main()
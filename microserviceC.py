@@ -1,56 +1,262 @@
+"""
+Microservice C: Transaction Charts
+
+Listens on ZeroMQ ROUTER at tcp://*:5554 (clients use plain REQ sockets).
+
+Chart data comes from a single aggregation over the rollups collection. Charts
+are drawn with matplotlib's object-oriented Figure API on the Agg backend in a
+pool of worker processes (MICROSERVICE_C_WORKERS, default one per core), so
+several clients can be rendered for at the same time.
+
+Rendered PNGs are cached by a hash of the chart type and the data they were
+drawn from, so a chart is only re-rendered when the data changes. Requests:
+  - "generate_chart": replies with the income vs expense PNG bytes (or an
+    error string)
+  - {"command": "generate_chart", "chart": "<type>", "etag": "<hash or null>"}:
+    replies with three frames [status, etag, body] where status is "ok" (body
+    is the PNG), "not_modified" (the client's etag is current, body is empty)
+    or "error" (body is the message)
+  - {"command": "stats"}: replies with request and MongoDB latency metrics as
+    JSON (see metrics.py)
+
+Chart types: income_expense (default), monthly_trend, category_breakdown,
+running_balance.
+"""
+import hashlib
+import json
+import logging
+import time
 import zmq
-import matplotlib.pyplot as plt
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
 import io
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from pymongo import MongoClient
 from dotenv import load_dotenv
 import os
+import rollups
+from metrics import MongoCommandTimer, ServiceMetrics, setup_logging
 
-load_dotenv()
-client = MongoClient(os.getenv("MONGODB_URI"))
-db = client["budgetwise_db"]
-transactions = db["transactions"]
+MAX_CACHED_CHARTS = 32
+WORKER_COUNT = int(os.getenv("MICROSERVICE_C_WORKERS", str(os.cpu_count() or 1)))
 
-context = zmq.Context()
-socket = context.socket(zmq.REP)
-socket.bind("tcp://*:5554")
+log = logging.getLogger("microserviceC")
+metrics = ServiceMetrics("microserviceC")
 
-print("Microservice C running on port 5554...")
+# Rendered PNGs keyed by the hash of their chart data, least recently used first
+chart_cache = OrderedDict()
 
-while True:
-    print("Waiting for request...")
-    message = socket.recv_string()
-    print("Received:", message)
+# Totals per type
+def income_expense_data(summary):
+    return [
+        {"label": r["group"]["type"], "total": r["net"]}
+        for r in summary(("type",))
+    ]
 
-    if message != "generate_chart":
-        socket.send_string("Invalid request")
-        continue
+# Income and expenses per month
+def monthly_trend_data(summary):
+    return [
+        {"label": r["group"]["month"], "income": r["income"], "expenses": r["expenses"]}
+        for r in summary(("month",))
+    ]
 
-    pipeline = [{"$group": {"_id": "$type", "total": {"$sum": "$amount"}}}]
-    results = list(transactions.aggregate(pipeline))
-    print("Bar chart results:", results)
+# Expenses per category
+def category_breakdown_data(summary):
+    return [
+        {"label": r["group"]["category"], "total": r["expenses"]}
+        for r in summary(("category",))
+        if r["expenses"] < 0
+    ]
 
-    if not results:
-        socket.send_string("No data found to generate chart.")
-        continue
+# Balance at the end of every month
+def running_balance_data(summary):
+    balance = 0
+    rows = []
+    for r in summary(("month",)):
+        balance += r["net"]
+        rows.append({"label": r["group"]["month"], "balance": balance})
+    return rows
+
+CHART_DATA = {
+    "income_expense": income_expense_data,
+    "monthly_trend": monthly_trend_data,
+    "category_breakdown": category_breakdown_data,
+    "running_balance": running_balance_data,
+}
+
+# Content hash of the chart data, used as the cache key and the client's etag
+def chart_etag(chart, results):
+    payload = json.dumps({"chart": chart, "data": results}, sort_keys=True, default=str).encode()
+    return hashlib.sha256(payload).hexdigest()
 
-    try:
-        # Build chart in memory
-        types = [r["_id"] for r in results]
+# Draws a chart and returns the PNG bytes; runs in a worker process
+def render_chart(chart, results):
+    fig = Figure(figsize=(8, 4) if chart != "income_expense" else (6, 4))
+    ax = fig.subplots()
+    labels = [r["label"] for r in results]
+
+    if chart == "income_expense":
         totals = [abs(r["total"]) for r in results]
+        ax.bar(labels, totals, color=["green" if t == "income" else "red" for t in labels])
+        ax.set_title("Income vs Expense")
+        ax.set_ylabel("Amount")
+        ax.set_xlabel("Type")
+    elif chart == "monthly_trend":
+        ax.plot(labels, [r["income"] for r in results], marker="o", color="green", label="Income")
+        ax.plot(labels, [abs(r["expenses"]) for r in results], marker="o", color="red", label="Expenses")
+        ax.set_title("Monthly Income and Expenses")
+        ax.set_ylabel("Amount")
+        ax.set_xlabel("Month")
+        ax.legend()
+        ax.tick_params(axis="x", labelrotation=45)
+    elif chart == "category_breakdown":
+        ax.barh(labels, [abs(r["total"]) for r in results], color="red")
+        ax.set_title("Expenses by Category")
+        ax.set_xlabel("Amount")
+    elif chart == "running_balance":
+        ax.plot(labels, [r["balance"] for r in results], marker="o")
+        ax.axhline(0, color="grey", linewidth=0.8)
+        ax.set_title("Running Balance")
+        ax.set_ylabel("Balance")
+        ax.set_xlabel("Month")
+        ax.tick_params(axis="x", labelrotation=45)
+
+    fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
+
+# Stores a rendered PNG in the cache
+def cache_chart(etag, png):
+    chart_cache[etag] = png
+    while len(chart_cache) > MAX_CACHED_CHARTS:
+        chart_cache.popitem(last=False)
+
+# Works out the reply for a chart request without rendering
+def prepare_chart(db, chart="income_expense", client_etag=None, summary=None):
+    """
+    Returns (status, etag, body, results). status is "render" when the chart
+    still has to be drawn from results. The data is read from db's rollups
+    unless summary(group_by) is given, which must return rows in the format
+    of rollups.rollup_summary (SQLite storage passes its own).
+    """
+    if chart not in CHART_DATA:
+        return "error", "", f"Error: unknown chart type '{chart}'".encode(), None
+
+    if summary is None:
+        summary = lambda group_by: rollups.rollup_summary(db, group_by)
+    results = CHART_DATA[chart](summary)
+    if not results:
+        return "error", "", b"No data found to generate chart.", None
+
+    etag = chart_etag(chart, results)
+    if etag == client_etag:
+        return "not_modified", etag, b"", None
+    png = chart_cache.get(etag)
+    if png is not None:
+        chart_cache.move_to_end(etag)
+        return "ok", etag, png, None
+    return "render", etag, b"", results
+
+# Answers a chart request in this process and returns (status, etag, body)
+def generate_chart(db, chart="income_expense", client_etag=None, summary=None):
+    status, etag, body, results = prepare_chart(db, chart, client_etag, summary)
+    if status == "render":
+        body = render_chart(chart, results)
+        cache_chart(etag, body)
+        status = "ok"
+    return status, etag, body
+
+# Builds the reply frames for a request in the format it was asked in
+def reply_frames(legacy, status, etag, body):
+    if legacy:
+        return [body]  # Binary image data (or the error text) directly
+    return [status.encode(), etag.encode(), body]
+
+def main():
+    setup_logging()
+    metrics.start_prometheus_dump()
+    load_dotenv()
+    client = MongoClient(os.getenv("MONGODB_URI"), event_listeners=[MongoCommandTimer(metrics)])
+    db = client["budgetwise_db"]
+
+    context = zmq.Context()
+    socket = context.socket(zmq.ROUTER)
+    socket.bind("tcp://*:5554")
+    poller = zmq.Poller()
+    poller.register(socket, zmq.POLLIN)
+
+    pool = ProcessPoolExecutor(max_workers=WORKER_COUNT)
+    # etag -> (future, [(envelope, legacy, started, request_bytes), ...]) so identical renders are shared
+    pending = {}
+
+    # Sends a chart reply and records how long the request took
+    def send_reply(envelope, legacy, started, request_bytes, status, etag, body):
+        frames = reply_frames(legacy, status, etag, body)
+        socket.send_multipart(envelope + frames)
+        if status == "error":
+            metrics.error("generate_chart")
+        metrics.observe("generate_chart", time.perf_counter() - started, request_bytes, sum(len(f) for f in frames))
+
+    log.info("Microservice C running on port 5554 with %d render workers", WORKER_COUNT)
+
+    while True:
+        events = dict(poller.poll(50 if pending else None))
+
+        if socket in events:
+            frames = socket.recv_multipart()
+            started = time.perf_counter()
+            delimiter = frames.index(b"")
+            envelope, message = frames[:delimiter + 1], frames[delimiter + 1].decode()
+            log.debug("Received: %s", message)
+
+            legacy = message == "generate_chart"
+            if legacy:
+                request = {"command": "generate_chart"}
+            else:
+                try:
+                    request = json.loads(message)
+                except ValueError:
+                    request = {}
+            if isinstance(request, dict) and request.get("command") == "stats":
+                socket.send_multipart(envelope + [json.dumps(metrics.snapshot()).encode()])
+                continue
+            if not isinstance(request, dict) or request.get("command") != "generate_chart":
+                socket.send_multipart(envelope + [b"Invalid request"])
+                metrics.error("invalid")
+                continue
+
+            chart = request.get("chart", "income_expense")
+            try:
+                status, etag, body, results = prepare_chart(db, chart, request.get("etag"))
+            except Exception as e:
+                log.exception("Chart request failed")
+                status, etag, body, results = "error", "", f"Error: {e}".encode(), None
+
+            waiter = (envelope, legacy, started, len(message))
+            if status != "render":
+                send_reply(*waiter, status, etag, body)
+                log.debug("Chart reply sent to client: %s", status)
+            elif etag in pending:
+                pending[etag][1].append(waiter)
+            else:
+                future = pool.submit(render_chart, chart, results)
+                pending[etag] = (future, [waiter])
+
+        # Send every render that has finished
+        for etag in [etag for etag, (future, _) in pending.items() if future.done()]:
+            future, waiters = pending.pop(etag)
+            try:
+                status, body = "ok", future.result()
+                cache_chart(etag, body)
+            except Exception as e:
+                log.error("Render failed: %s", e)
+                status, body = "error", f"Error: {e}".encode()
+            for waiter in waiters:
+                send_reply(*waiter, status, etag, body)
+            log.debug("Chart sent to %d client(s): %s", len(waiters), status)
 
-        plt.figure(figsize=(6, 4))
-        plt.bar(types, totals, color=["green" if t == "income" else "red" for t in types])
-        plt.title("Income vs Expense")
-        plt.ylabel("Amount")
-        plt.xlabel("Type")
-
-        buf = io.BytesIO()
-        plt.savefig(buf, format="png")
-        plt.close()
-        buf.seek(0)
-
-        socket.send(buf.read())  # Send binary image data directly
-        print("Chart sent to client.")
-    except Exception as e:
-        print("Error:", e)
-        socket.send_string(f"Error: {e}")
+if __name__ == "__main__":
+    main()
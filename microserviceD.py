@@ -1,10 +1,35 @@
+"""
+Microservice D: Savings
+
+Listens on ZeroMQ REP at tcp://*:5552. Savings are read straight from the
+transactions collection (type "savings") over a (type, date, _id) index, so
+edits and deletes show up in the next reply.
+
+JSON commands (all accept optional "from"/"to" dates as "YYYY-MM-DD"):
+  - {"command": "totals"}: total savings and entry count
+  - {"command": "monthly"}: savings per month
+  - {"command": "entries", "page_size": 20, "after": <token>}: one page of
+    entries ordered by date; "next" in the reply is the token for the next page
+  - {"command": "stats"}: request and MongoDB latency metrics (see metrics.py)
+The plain "get_total_savings" string request still returns the text report.
+"""
+import json
+import logging
+import time
+from datetime import datetime
 import zmq
 from dotenv import load_dotenv
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 import os
+from pymongo import ASCENDING
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
 from prettytable import PrettyTable
+from metrics import MongoCommandTimer, ServiceMetrics, setup_logging
 
+log = logging.getLogger("microserviceD")
+metrics = ServiceMetrics("microserviceD")
 
 load_dotenv()
 
@@ -12,58 +37,164 @@ uri = os.getenv("MONGODB_URI")
 if uri is None:
     raise ValueError("MONGODB_URI is not valid.")
 
-client = MongoClient(uri, server_api=ServerApi('1'))
+client = MongoClient(uri, server_api=ServerApi('1'), event_listeners=[MongoCommandTimer(metrics)])
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+indexes_ready = False
 
 def get_db():
     return client["budgetwise_db"]
 
+# Creates the index the savings queries rely on, once per process
+def ensure_indexes(db):
+    global indexes_ready
+    if indexes_ready:
+        return
+    db.transactions.create_index([("type", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)])
+    indexes_ready = True
+
+# Builds the savings filter for a request's optional "from"/"to" dates
+def date_match(req):
+    match = {"type": "savings"}
+    date_range = {}
+    if req.get("from"):
+        datetime.strptime(req["from"], "%Y-%m-%d")
+        date_range["$gte"] = req["from"]
+    if req.get("to"):
+        datetime.strptime(req["to"], "%Y-%m-%d")
+        date_range["$lte"] = req["to"]
+    if date_range:
+        match["date"] = date_range
+    return match
+
+# Returns {"total", "count"} for the requested date range
+def savings_totals(db, req):
+    results = list(db.transactions.aggregate([
+        {"$match": date_match(req)},
+        {"$group": {"_id": None, "total": {"$sum": "$amount"}, "count": {"$sum": 1}}}
+    ]))
+    if not results:
+        return {"total": 0, "count": 0}
+    return {"total": results[0]["total"], "count": results[0]["count"]}
+
+# Returns savings per month for the requested date range
+def savings_by_month(db, req):
+    return [
+        {"month": r["_id"], "total": r["total"], "count": r["count"]}
+        for r in db.transactions.aggregate([
+            {"$match": date_match(req)},
+            {"$group": {
+                "_id": {"$substr": ["$date", 0, 7]},
+                "total": {"$sum": "$amount"},
+                "count": {"$sum": 1},
+            }},
+            {"$sort": {"_id": 1}},
+        ])
+    ]
+
+# Returns one page of entries ordered by (date, _id) and the token for the next page
+def savings_entries(db, req):
+    page_size = max(1, min(int(req.get("page_size", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+    query = date_match(req)
+    after = req.get("after")
+    if after:
+        after_date, after_id = after["date"], ObjectId(after["id"])
+        query = {"$and": [query, {"$or": [
+            {"date": {"$gt": after_date}},
+            {"date": after_date, "_id": {"$gt": after_id}},
+        ]}]}
+
+    docs = list(
+        db.transactions.find(query, {"date": 1, "amount": 1})
+        .sort([("date", ASCENDING), ("_id", ASCENDING)])
+        .limit(page_size + 1)
+    )
+    next_token = None
+    if len(docs) > page_size:
+        docs = docs[:page_size]
+        next_token = {"date": docs[-1]["date"], "id": str(docs[-1]["_id"])}
+    entries = [{"id": str(d["_id"]), "date": d.get("date"), "amount": d.get("amount", 0)} for d in docs]
+    return entries, next_token
+
+# Answers a JSON command
+def handle_command(req):
+    if req.get("command") == "stats":
+        return {"status": "ok", "metrics": metrics.snapshot()}
+    db = get_db()
+    ensure_indexes(db)
+    command = req.get("command")
+    try:
+        if command == "totals":
+            return {"status": "ok", **savings_totals(db, req)}
+        if command == "monthly":
+            return {"status": "ok", "months": savings_by_month(db, req)}
+        if command == "entries":
+            entries, next_token = savings_entries(db, req)
+            return {"status": "ok", "entries": entries, "next": next_token}
+    except (ValueError, KeyError, InvalidId) as e:
+        return {"status": "error", "message": f"Invalid request: {e}"}
+    return {"status": "error", "message": "Unknown command"}
+
 def calculate_total_savings():
     db = get_db()
-    source_collection = db.transactions
-    savings_docs = list(source_collection.find({"type": "savings"}))
+    ensure_indexes(db)
 
     table = PrettyTable()
     table.field_names = ["Date", "Amount (USD)"]
     table.align["Date"] = "l"
     table.align["Amount (USD)"] = "r"
 
-    total = 0
-    for doc in savings_docs:
-        amount = doc.get("amount", 0)
-        date = doc.get("date")
-
-        table.add_row([date, f"${amount:,.2f}"])
-        total += amount
-
-        # Save to per-entry collection
-        collection_name = "savings_transactions"
-        savings_data = {"date": date, "amount": amount}
-        if not db[collection_name].find_one(savings_data):
-            db[collection_name].insert_one(savings_data)
+    for doc in db.transactions.find(date_match({}), {"_id": 0, "date": 1, "amount": 1}).sort("date", ASCENDING):
+        table.add_row([doc.get("date"), f"${doc.get('amount', 0):,.2f}"])
 
+    total = savings_totals(db, {})["total"]
     output = f"Savings Breakdown:\n{table}\nTotal Savings: ${total:,.2f}"
     return output
 
+# Answers one request string and returns the reply string
+def handle_message(message):
+    if message == "get_total_savings":
+        return "get_total_savings", calculate_total_savings()
+
+    try:
+        req = json.loads(message)
+    except ValueError:
+        metrics.error("invalid")
+        return "invalid", "Unknown command"
+    command = str(req.get("command")) if isinstance(req, dict) else "invalid"
+    try:
+        reply = handle_command(req)
+    except Exception as e:
+        log.exception("Request failed")
+        reply = {"status": "error", "message": f"Server error: {e}"}
+    if reply["status"] == "error":
+        metrics.error(command)
+    return command, json.dumps(reply)
+
 def main():
+    metrics.start_prometheus_dump()
     context = zmq.Context()
     socket = context.socket(zmq.REP)
     socket.bind("tcp://*:5552")
 
-    print("Savings microservice running on tcp://*:5552")
+    log.info("Savings microservice running on tcp://*:5552")
 
     while True:
         message = socket.recv_string()
-        print(f"Received request: {message}")
-
-        if message == "get_total_savings":
-            report = calculate_total_savings()
-            socket.send_string(report)
-        else:
-            socket.send_string("Unknown command")
-
-try:
-    client.admin.command('ping')
-    print("Connected to MongoDB")
-    main()
-except Exception as e:
-    print(f"Failed to connect to MongoDB: {e}")
+        started = time.perf_counter()
+        log.debug("Received request: %s", message)
+
+        command, reply = handle_message(message)
+        socket.send_string(reply)
+        metrics.observe(command, time.perf_counter() - started, len(message.encode()), len(reply.encode()))
+
+if __name__ == "__main__":
+    setup_logging()
+    try:
+        client.admin.command('ping')
+        log.info("Connected to MongoDB")
+        main()
+    except Exception as e:
+        log.error("Failed to connect to MongoDB: %s", e)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Menu action profiling
+
+Opt-in profiling for budget_app. Turn it on with `python budget_app.py
+--profile DIR` or by setting BUDGETWISE_PROFILE_DIR; every menu action
+decorated with @profiled then runs under cProfile and tracemalloc and writes:
+  - DIR/<action>-<timestamp>-<pid>.prof: the cProfile stats for that run
+  - DIR/memory.jsonl: one line per run with the wall time, peak traced memory
+    and the lines that allocated the most
+
+Time spent waiting for the user shows up under builtins.input.
+
+Report across every run in a directory:
+    python profiling.py report DIR [--top 25] [--action view_budget] [--sort tottime]
+"""
+import argparse
+import cProfile
+import functools
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+
+MEMORY_LOG = "memory.jsonl"
+TOP_ALLOCATIONS = 5
+
+profile_dir = os.getenv("BUDGETWISE_PROFILE_DIR") or None
+_active = False
+
+# Turns profiling on and sets where the results are written
+def enable(directory):
+    global profile_dir
+    os.makedirs(directory, exist_ok=True)
+    profile_dir = directory
+
+# Decorator: profiles a menu action when profiling is enabled
+def profiled(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        global _active
+        # Nested actions are part of the outer action's profile
+        if not profile_dir or _active:
+            return func(*args, **kwargs)
+
+        _active = True
+        profiler = cProfile.Profile()
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            _active = False
+            save_run(func.__name__, profiler, seconds, peak, snapshot)
+    return wrapper
+
+# Writes the profile and memory summary of one run
+def save_run(action, profiler, seconds, peak, snapshot):
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    os.makedirs(profile_dir, exist_ok=True)
+    profiler.dump_stats(os.path.join(profile_dir, f"{action}-{stamp}-{os.getpid()}.prof"))
+
+    top = snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+    record = {
+        "action": action,
+        "time": stamp,
+        "seconds": round(seconds, 6),
+        "peak_bytes": peak,
+        "top_allocations": [
+            {"line": f"{s.traceback[0].filename}:{s.traceback[0].lineno}", "bytes": s.size, "count": s.count}
+            for s in top
+        ],
+    }
+    with open(os.path.join(profile_dir, MEMORY_LOG), "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+# Prints the hottest functions and per-action memory across every run in a directory
+def report(directory, top=25, action=None, sort="cumulative"):
+    import glob
+    import pstats
+
+    pattern = f"{action}-*.prof" if action else "*.prof"
+    files = sorted(glob.glob(os.path.join(directory, pattern)))
+    if not files:
+        print(f"No profiles found in {directory}")
+        return
+
+    print(f"Hottest functions over {len(files)} run(s), sorted by {sort}:")
+    stats = pstats.Stats(*files)
+    stats.strip_dirs().sort_stats(sort).print_stats(top)
+
+    runs = {}
+    memory_log = os.path.join(directory, MEMORY_LOG)
+    if os.path.exists(memory_log):
+        with open(memory_log) as f:
+            for line in f:
+                record = json.loads(line)
+                if not action or record["action"] == action:
+                    runs.setdefault(record["action"], []).append(record)
+
+    print(f"{'Action':32} {'Runs':>5} {'Mean time':>10} {'Max time':>10} {'Peak memory':>12}")
+    for name, records in sorted(runs.items(), key=lambda item: -max(r["seconds"] for r in item[1])):
+        seconds = [r["seconds"] for r in records]
+        peak = max(r["peak_bytes"] for r in records)
+        print(f"{name:32} {len(records):5} {sum(seconds) / len(seconds):9.3f}s {max(seconds):9.3f}s "
+              f"{peak / 1024:10.1f}KB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank the hottest functions across profiled budget_app runs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report")
+    report_parser.add_argument("directory", nargs="?", default=profile_dir or "profiles")
+    report_parser.add_argument("--top", type=int, default=25)
+    report_parser.add_argument("--action", help="only include runs of this menu action")
+    report_parser.add_argument("--sort", default="cumulative", choices=("cumulative", "tottime", "ncalls"))
+    args = parser.parse_args()
+    report(args.directory, args.top, args.action, args.sort)
@@ -0,0 +1,145 @@
+"""
+Recurrence rules
+
+Calendar-accurate schedules for recurring transactions:
+  - daily, weekly, bi-weekly: fixed number of days
+  - monthly: same day every month, clamped to the last day of short months
+    (a rule anchored on the 31st posts on Feb 28/29 and again on Mar 31)
+  - end-of-month: last day of every month
+  - yearly: same date every year (Feb 29 falls back to Feb 28)
+
+build_transaction() turns one occurrence of a rule into the transaction that
+gets posted for it. migrate_recurrence() brings rules saved by older versions
+(free-text frequencies, no anchor_day) up to these rules.
+"""
+import calendar
+from datetime import datetime, timedelta
+
+FREQUENCY_DAYS = {
+    "daily": 1,
+    "weekly": 7,
+    "bi-weekly": 14,
+}
+FREQUENCY_MONTHS = {
+    "monthly": 1,
+    "yearly": 12,
+}
+FREQUENCIES = tuple(FREQUENCY_DAYS) + tuple(FREQUENCY_MONTHS) + ("end-of-month",)
+
+# Other spellings older versions stored as typed
+FREQUENCY_ALIASES = {
+    "day": "daily",
+    "week": "weekly",
+    "biweekly": "bi-weekly",
+    "bi weekly": "bi-weekly",
+    "fortnightly": "bi-weekly",
+    "month": "monthly",
+    "end of month": "end-of-month",
+    "year": "yearly",
+    "annual": "yearly",
+    "annually": "yearly",
+}
+
+# Returns the last day of the month for a date
+def end_of_month(day):
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+# Moves a date forward by whole months, keeping the anchor day where possible
+def add_months(day, months, anchor_day):
+    month_index = day.month - 1 + months
+    year = day.year + month_index // 12
+    month = month_index % 12 + 1
+    last_day = calendar.monthrange(year, month)[1]
+    return day.replace(year=year, month=month, day=min(anchor_day, last_day))
+
+# Checks that a frequency is supported
+def validate_frequency(frequency):
+    if frequency not in FREQUENCIES:
+        raise ValueError(
+            f"Unknown frequency '{frequency}'. Use one of: {', '.join(FREQUENCIES)}"
+        )
+
+# Maps a stored frequency to a supported one
+def normalize_frequency(frequency):
+    """
+    Returns (frequency, known). Unknown frequencies fall back to monthly, the
+    closest match to the 30-day interval older versions used for them.
+    """
+    value = str(frequency or "").strip().lower()
+    value = FREQUENCY_ALIASES.get(value, value)
+    if value in FREQUENCIES:
+        return value, True
+    return "monthly", False
+
+# Returns the recurrence fields a stored rule needs changed, or {} when it is current
+def migrate_recurrence(recurrence):
+    """
+    Normalizes the frequency (keeping an unknown one in original_frequency)
+    and backfills anchor_day for monthly and yearly rules from next_due.
+    """
+    updates = {}
+    frequency, known = normalize_frequency(recurrence.get("frequency"))
+    if frequency != recurrence.get("frequency"):
+        updates["frequency"] = frequency
+        if not known:
+            updates["original_frequency"] = recurrence.get("frequency")
+    if frequency in FREQUENCY_MONTHS and recurrence.get("anchor_day") is None:
+        try:
+            updates["anchor_day"] = datetime.strptime(recurrence.get("next_due") or "", "%Y-%m-%d").day
+        except ValueError:
+            pass
+    return updates
+
+# Normalizes the first due date of a rule (end-of-month rules start on a month end)
+def first_occurrence(start, frequency):
+    if frequency == "end-of-month":
+        return end_of_month(start)
+    return start
+
+# Returns the occurrence after `due`
+def next_occurrence(due, frequency, anchor_day=None):
+    """
+    anchor_day is the day of month the rule was created on; it defaults to
+    due.day and keeps monthly/yearly rules from drifting after a short month.
+    """
+    validate_frequency(frequency)
+    if frequency in FREQUENCY_DAYS:
+        return due + timedelta(days=FREQUENCY_DAYS[frequency])
+    if frequency == "end-of-month":
+        return end_of_month(add_months(due, 1, 1))
+    return add_months(due, FREQUENCY_MONTHS[frequency], anchor_day or due.day)
+
+# Expands every occurrence from `due` up to and including `until`
+def expand_occurrences(due, frequency, until, anchor_day=None):
+    """
+    Returns (occurrences, next_due) where next_due is the first occurrence
+    after `until`.
+    """
+    occurrences = []
+    while due <= until:
+        occurrences.append(due)
+        due = next_occurrence(due, frequency, anchor_day)
+    return occurrences, due
+
+# Builds the transaction posted for one occurrence of a recurring rule
+def build_transaction(rule, due_date):
+    amount = rule.get("amount", 0)
+    txn_type = rule.get("type")
+    if not txn_type:
+        txn_type = "income" if amount > 0 else "expense"
+
+    # Makes sure expense is negative and income is positive
+    if txn_type == "expense" and amount > 0:
+        amount = -abs(amount)
+    elif txn_type == "income" and amount < 0:
+        amount = abs(amount)
+
+    return {
+        "date": str(due_date),
+        "type": txn_type,
+        "description": rule.get("description", "no description"),
+        "category": rule.get("category", "uncategorized"),
+        "amount": amount,
+        # Idempotency key: one posting per rule and due date, enforced by a unique index
+        "recurring_key": f"{rule['_id']}:{due_date}",
+    }
@@ -0,0 +1,203 @@
+"""
+Transaction rollups
+
+Keeps a small "rollups" collection with one document per (month, type, category)
+holding income, expense, net and count totals. Every write to the transactions
+collection applies a $inc delta here, so reports can read tens of rollup rows
+instead of scanning the whole ledger.
+
+The first time a database is read, the rollups are rebuilt from the whole
+ledger and a marker is stored in "rollup_state", so ledgers that existed before
+the rollups are counted in full. Run `python rollups.py rebuild` to recompute
+the rollups from the ledger and fix any drift.
+"""
+import sys
+from datetime import datetime
+from pymongo import UpdateOne, ReplaceOne
+
+from budget_summary import build_summary_pipeline
+
+ROLLUP_COLLECTION = "rollups"
+ROLLUP_STATE_COLLECTION = "rollup_state"
+
+# Databases whose rollups are known to be built, so the marker is read once per process
+_built = set()
+
+# Builds the rollup key for a transaction document
+def rollup_key(transaction):
+    """
+    Returns the rollup _id for a transaction: {"month", "type", "category"}.
+    The field order is fixed so equal keys always match in MongoDB.
+    """
+    return {
+        "month": str(transaction.get("date", ""))[:7],
+        "type": transaction.get("type"),
+        "category": transaction.get("category"),
+    }
+
+# Builds the $inc delta a transaction contributes to its rollup
+def transaction_delta(transaction, sign=1):
+    amount = transaction.get("amount", 0) or 0
+    return {
+        "income": sign * amount if amount >= 0 else 0,
+        "expenses": sign * amount if amount < 0 else 0,
+        "net": sign * amount,
+        "count": sign,
+    }
+
+# Adds the deltas of one or more transactions to their rollups in one round trip
+def apply_transactions(db, transactions, sign=1):
+    """
+    Applies the rollup deltas for the given transactions.
+    Use sign=1 for inserted transactions and sign=-1 for deleted ones.
+    """
+    deltas = {}
+    for transaction in transactions:
+        key = rollup_key(transaction)
+        marker = (key["month"], key["type"], key["category"])
+        delta = transaction_delta(transaction, sign)
+        if marker in deltas:
+            for field, value in delta.items():
+                deltas[marker][1][field] += value
+        else:
+            deltas[marker] = (key, delta)
+
+    if not deltas:
+        return
+    db[ROLLUP_COLLECTION].bulk_write(
+        [UpdateOne({"_id": key}, {"$inc": delta}, upsert=True) for key, delta in deltas.values()],
+        ordered=False,
+    )
+
+# Applies the rollup delta for a single inserted or deleted transaction
+def apply_transaction(db, transaction, sign=1):
+    apply_transactions(db, [transaction], sign)
+
+# Moves a transaction's contribution from its old values to its new values
+def apply_update(db, old_transaction, new_transaction):
+    old_delta = transaction_delta(old_transaction, -1)
+    new_delta = transaction_delta(new_transaction, 1)
+    if rollup_key(old_transaction) == rollup_key(new_transaction):
+        delta = {field: old_delta[field] + new_delta[field] for field in new_delta}
+        db[ROLLUP_COLLECTION].update_one(
+            {"_id": rollup_key(new_transaction)}, {"$inc": delta}, upsert=True
+        )
+    else:
+        db[ROLLUP_COLLECTION].bulk_write([
+            UpdateOne({"_id": rollup_key(old_transaction)}, {"$inc": old_delta}, upsert=True),
+            UpdateOne({"_id": rollup_key(new_transaction)}, {"$inc": new_delta}, upsert=True),
+        ], ordered=False)
+
+# Applies the rollup deltas for every transaction matching a filter
+def apply_matching(db, match, sign=1):
+    """
+    Applies deltas for all transactions matching `match` using one aggregation,
+    e.g. right before a delete_many with the same filter.
+    """
+    pipeline = build_summary_pipeline(("month", "type", "category"), match)
+    requests = []
+    for row in db.transactions.aggregate(pipeline):
+        key = {
+            "month": row["group"].get("month"),
+            "type": row["group"].get("type"),
+            "category": row["group"].get("category"),
+        }
+        delta = {field: sign * row[field] for field in ("income", "expenses", "net", "count")}
+        requests.append(UpdateOne({"_id": key}, {"$inc": delta}, upsert=True))
+    if requests:
+        db[ROLLUP_COLLECTION].bulk_write(requests, ordered=False)
+
+# Recomputes every rollup from the ledger and removes stale rows
+def rebuild_rollups(db):
+    """
+    Reconciles the rollups collection with the transactions collection.
+    Returns the number of rollup rows written.
+    """
+    pipeline = build_summary_pipeline(("month", "type", "category"))
+    requests = []
+    keys = []
+    for row in db.transactions.aggregate(pipeline):
+        key = {
+            "month": row["group"].get("month"),
+            "type": row["group"].get("type"),
+            "category": row["group"].get("category"),
+        }
+        keys.append(key)
+        requests.append(ReplaceOne(
+            {"_id": key},
+            {
+                "income": row["income"],
+                "expenses": row["expenses"],
+                "net": row["net"],
+                "count": row["count"],
+            },
+            upsert=True,
+        ))
+    if requests:
+        db[ROLLUP_COLLECTION].bulk_write(requests, ordered=False)
+    db[ROLLUP_COLLECTION].delete_many({"_id": {"$nin": keys}})
+    db[ROLLUP_STATE_COLLECTION].update_one(
+        {"_id": ROLLUP_COLLECTION}, {"$set": {"built_at": datetime.now()}}, upsert=True
+    )
+    return len(requests)
+
+# Builds the rollups the first time they are needed
+def ensure_rollups(db):
+    """
+    Deltas may already have created rollup rows for new writes, so whether
+    the historic ledger was rolled up is decided by the marker that
+    rebuild_rollups stores, not by the rollups collection being empty.
+    """
+    key = (id(db.client), db.name)
+    if key in _built:
+        return
+    if db[ROLLUP_STATE_COLLECTION].find_one({"_id": ROLLUP_COLLECTION}) is None:
+        rebuild_rollups(db)
+    _built.add(key)
+
+# Sums rollup rows, optionally split by month, type and/or category
+def rollup_summary(db, group_by=(), match=None):
+    """
+    Returns {"group", "income", "expenses", "net", "count"} documents, one per group
+    (or a single document when group_by is empty), read from the rollups.
+    `match` filters on rollup key fields, e.g. {"_id.type": "income"}.
+    """
+    ensure_rollups(db)
+    pipeline = []
+    if match:
+        pipeline.append({"$match": match})
+    pipeline.append({
+        "$group": {
+            "_id": {field: f"$_id.{field}" for field in group_by} if group_by else None,
+            "income": {"$sum": "$income"},
+            "expenses": {"$sum": "$expenses"},
+            "net": {"$sum": "$net"},
+            "count": {"$sum": "$count"},
+        }
+    })
+    pipeline.append({
+        "$project": {"_id": 0, "group": "$_id", "income": 1, "expenses": 1, "net": 1, "count": 1}
+    })
+    if group_by:
+        pipeline.append({"$sort": {f"group.{field}": 1 for field in group_by}})
+    return list(db[ROLLUP_COLLECTION].aggregate(pipeline))
+
+# Returns the overall totals from the rollups
+def rollup_totals(db):
+    results = rollup_summary(db)
+    if not results:
+        return {"income": 0, "expenses": 0, "net": 0, "count": 0}
+    totals = results[0]
+    totals.pop("group", None)
+    return totals
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] != "rebuild":
+        print("Usage: python rollups.py rebuild")
+        sys.exit(1)
+
+    from db_connection import get_db
+
+    written = rebuild_rollups(get_db())
+    print(f"Rebuilt {written} rollup row(s).")
@@ -0,0 +1,998 @@
+"""
+Storage backends
+
+One repository interface covers everything budget_app reads and writes:
+transactions, budget goals, filters, recurring rules, savings and charts.
+Two implementations:
+  - MongoRepository: the MongoDB collections the microservices also use. Writes
+    keep the rollups, tracked goal progress and the ledger version counter up
+    to date. Filters, recurring rules, savings and charts are delegated to
+    Microservices A, B, D and C over zmq_client.
+  - SQLiteRepository: an embedded SQLite file (WAL journal, indexed) for
+    single-user and offline use, or ":memory:" for tests. Nothing else shares
+    it, so it answers all of the above in-process. Triggers keep tracked goal
+    progress up to date.
+
+Requests a backend rejects (a bad date, an unknown frequency, an error reply
+from a microservice) raise ValueError; a microservice that does not answer
+raises zmq_client.ServiceUnavailable.
+
+Ids are ObjectId hex strings in both backends. Transaction filters are plain
+dicts with any of "ids", "month" ("YYYY-MM"), "type" and "category". Every
+transaction write stamps "updated_at", so a reader can fetch only what changed
+since it last looked (see changed_transactions and transaction_cache.py).
+
+Pick the backend with BUDGETWISE_STORAGE=mongo (default) or sqlite; the SQLite
+file is BUDGETWISE_SQLITE_PATH (default budgetwise.db).
+"""
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+import goal_progress
+import rollups
+from budget_summary import month_range
+from ledger_version import DELETES_COUNTER, bump_version, get_version
+from recurrence import build_transaction, expand_occurrences, first_occurrence, validate_frequency
+
+TRANSACTION_FIELDS = ("date", "type", "description", "category", "amount")
+GOAL_FIELDS = ("goal_name", "target_amount", "current_amount") + goal_progress.TRACK_FIELDS
+DEFAULT_SQLITE_PATH = "budgetwise.db"
+# Number of filtered transactions Microservice A sends per chunk
+FILTER_CHUNK_SIZE = 500
+STATE_COLLECTION = "export_state"
+# Fields read for listing, paging and exporting transactions
+PROJECTION = {field: 1 for field in TRANSACTION_FIELDS}
+CHANGE_PROJECTION = {**PROJECTION, "updated_at": 1}
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+# Builds the keyset condition for rows before/after a (date, _id) position
+def keyset_condition(row, op):
+    """
+    op is "$lt"/"$lte" to move towards older rows or "$gt" to move towards newer rows.
+    """
+    strict = "$gt" if op == "$gt" else "$lt"
+    return {"$or": [
+        {"date": {strict: row["date"]}},
+        {"date": row["date"], "_id": {op: row["_id"]}},
+    ]}
+
+
+class Repository(ABC):
+    """
+    Storage interface used by budget_app. Documents are dicts with an "_id".
+    """
+
+    # Checks that a string is a valid id
+    def is_valid_id(self, value):
+        return ObjectId.is_valid(value)
+
+    # Transactions
+    @abstractmethod
+    def add_transaction(self, transaction):
+        ...
+
+    @abstractmethod
+    def get_transaction(self, transaction_id):
+        ...
+
+    @abstractmethod
+    def update_transaction(self, transaction_id, fields):
+        ...
+
+    @abstractmethod
+    def delete_transaction(self, transaction_id):
+        ...
+
+    @abstractmethod
+    def find_transactions(self, filters):
+        ...
+
+    @abstractmethod
+    def count_transactions(self, filters):
+        ...
+
+    @abstractmethod
+    def delete_transactions(self, filters):
+        ...
+
+    @abstractmethod
+    def recent_transactions(self, limit):
+        ...
+
+    @abstractmethod
+    def transaction_page(self, row, op, newest_first, limit):
+        ...
+
+    @abstractmethod
+    def iter_transactions(self, after_id=None, batch_size=1000):
+        ...
+
+    @abstractmethod
+    def totals(self):
+        ...
+
+    @abstractmethod
+    def changed_transactions(self, since=None, after_id=None):
+        ...
+
+    @abstractmethod
+    def transactions_version(self):
+        ...
+
+    @abstractmethod
+    def transactions_deleted(self):
+        ...
+
+    @abstractmethod
+    def get_export_state(self, state_id):
+        ...
+
+    @abstractmethod
+    def set_export_state(self, state_id, last_id):
+        ...
+
+    # Budget goals
+    @abstractmethod
+    def add_goal(self, goal):
+        ...
+
+    @abstractmethod
+    def list_goals(self):
+        ...
+
+    @abstractmethod
+    def get_goal(self, goal_id):
+        ...
+
+    @abstractmethod
+    def update_goal(self, goal_id, fields):
+        ...
+
+    @abstractmethod
+    def delete_goals(self, goal_ids):
+        ...
+
+    @abstractmethod
+    def count_goals(self, goal_ids):
+        ...
+
+    @abstractmethod
+    def recompute_goal_progress(self, goal_ids=None):
+        ...
+
+    # Filters, answered like Microservice A does
+    def filter_transactions(self, request):
+        """
+        Yields the results of a month/type/id filter in one or more chunks.
+        Each chunk is a list of transactions, one transaction, or {"error": ...}.
+        """
+        if "id" in request:
+            if not self.is_valid_id(request["id"]):
+                yield {"error": "Invalid id"}
+            else:
+                yield self.get_transaction(request["id"]) or {"error": "Transaction not found"}
+            return
+        try:
+            yield self.find_transactions(request)
+        except ValueError as e:
+            yield {"error": f"Invalid filter: {e}"}
+
+    # Returns (totals, the limit newest transactions)
+    def transaction_summary(self, limit):
+        return self.totals(), self.recent_transactions(limit)
+
+    # Recurring rules
+    @abstractmethod
+    def add_recurring_rule(self, rule):
+        ...
+
+    @abstractmethod
+    def apply_recurring(self):
+        ...
+
+    # Savings
+    @abstractmethod
+    def savings_totals(self, date_from=None, date_to=None):
+        ...
+
+    @abstractmethod
+    def savings_by_month(self, date_from=None, date_to=None):
+        ...
+
+    @abstractmethod
+    def savings_entries(self, date_from=None, date_to=None, after=None, page_size=20):
+        ...
+
+    # Charts
+    @abstractmethod
+    def chart(self, chart, etag=None):
+        ...
+
+
+class MongoRepository(Repository):
+    """
+    Repository over the budgetwise_db collections. Filters, recurring rules,
+    savings and charts are answered by the microservices.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.transactions = db.transactions
+        self.budget_goals = db.budget_goals
+        self._page_index_ready = False
+        self._updated_index_ready = False
+
+    # Converts the neutral filter format to a MongoDB query
+    def match(self, filters):
+        match = {}
+        if filters.get("ids") is not None:
+            match["_id"] = {"$in": [ObjectId(i) for i in filters["ids"]]}
+        if filters.get("month"):
+            start, end = month_range(filters["month"])
+            match["date"] = {"$gte": start, "$lt": end}
+        for field in ("type", "category"):
+            if filters.get(field):
+                match[field] = filters[field]
+        return match
+
+    # Bumps the version counter the microservice caches are keyed on
+    def _changed(self):
+        bump_version(self.db)
+
+    def add_transaction(self, transaction):
+        transaction["updated_at"] = updated_now()
+        result = self.transactions.insert_one(transaction)
+        rollups.apply_transaction(self.db, transaction)
+        goal_progress.apply_transaction(self.db, transaction)
+        self._changed()
+        return str(result.inserted_id)
+
+    def get_transaction(self, transaction_id):
+        return self.transactions.find_one({"_id": ObjectId(transaction_id)})
+
+    def update_transaction(self, transaction_id, fields):
+        old = self.transactions.find_one_and_update(
+            {"_id": ObjectId(transaction_id)}, {"$set": {**fields, "updated_at": updated_now()}}
+        )
+        if old is None:
+            return False
+        rollups.apply_update(self.db, old, {**old, **fields})
+        goal_progress.apply_update(self.db, old, {**old, **fields})
+        self._changed()
+        return True
+
+    def delete_transaction(self, transaction_id):
+        old = self.transactions.find_one_and_delete({"_id": ObjectId(transaction_id)})
+        if old is None:
+            return False
+        rollups.apply_transaction(self.db, old, sign=-1)
+        goal_progress.apply_transaction(self.db, old, sign=-1)
+        # Counted before the version moves, so a reader that sees the new version sees the delete
+        bump_version(self.db, DELETES_COUNTER)
+        self._changed()
+        return True
+
+    def find_transactions(self, filters):
+        return list(self.transactions.find(self.match(filters), PROJECTION).sort([("date", 1), ("_id", 1)]))
+
+    def count_transactions(self, filters):
+        match = self.match(filters)
+        if not match:
+            # Read from the collection metadata instead of counting the _id index
+            return self.transactions.estimated_document_count()
+        return self.transactions.count_documents(match)
+
+    def delete_transactions(self, filters):
+        match = self.match(filters)
+        rollups.apply_matching(self.db, match, sign=-1)
+        goal_progress.apply_matching(self.db, match, sign=-1)
+        deleted = self.transactions.delete_many(match).deleted_count
+        if deleted:
+            bump_version(self.db, DELETES_COUNTER, deleted)
+        self._changed()
+        return deleted
+
+    def recent_transactions(self, limit):
+        return list(self.transactions.find({}, PROJECTION).sort([("date", -1), ("_id", -1)]).limit(limit))
+
+    # Fetches up to limit rows before/after a (date, _id) position, see transaction_pager
+    def transaction_page(self, row, op, newest_first, limit):
+        if not self._page_index_ready:
+            self.transactions.create_index([("date", DESCENDING), ("_id", DESCENDING)])
+            self._page_index_ready = True
+        direction = -1 if newest_first else 1
+        query = keyset_condition(row, op) if row else {}
+        return list(
+            self.transactions.find(query, PROJECTION)
+            .sort([("date", direction), ("_id", direction)])
+            .limit(limit)
+        )
+
+    # Batched, projected cursor over the transactions after after_id, in _id order
+    def iter_transactions(self, after_id=None, batch_size=1000):
+        query = {"_id": {"$gt": after_id}} if after_id is not None else {}
+        return self.transactions.find(query, PROJECTION).sort("_id", 1).batch_size(batch_size)
+
+    def totals(self):
+        return rollups.rollup_totals(self.db)
+
+    # Transactions written at or after since, or inserted after after_id
+    def changed_transactions(self, since=None, after_id=None):
+        """
+        The _id condition also catches inserts from writers that do not stamp
+        updated_at. With neither bound every transaction is returned.
+        """
+        if not self._updated_index_ready:
+            self.transactions.create_index([("updated_at", ASCENDING)], sparse=True)
+            self._updated_index_ready = True
+        conditions = []
+        if since is not None:
+            conditions.append({"updated_at": {"$gte": since}})
+        if after_id is not None:
+            conditions.append({"_id": {"$gt": ObjectId(after_id)}})
+        query = {"$or": conditions} if conditions else {}
+        return self.transactions.find(query, CHANGE_PROJECTION).sort("_id", 1)
+
+    # Changes whenever any writer bumps the ledger version
+    def transactions_version(self):
+        return get_version(self.db)
+
+    # Number of transactions deleted so far
+    def transactions_deleted(self):
+        return get_version(self.db, DELETES_COUNTER)
+
+    def get_export_state(self, state_id):
+        state = self.db[STATE_COLLECTION].find_one({"_id": state_id})
+        return state["last_id"] if state else None
+
+    def set_export_state(self, state_id, last_id):
+        self.db[STATE_COLLECTION].update_one(
+            {"_id": state_id},
+            {"$set": {"last_id": last_id, "exported_at": datetime.now()}},
+            upsert=True,
+        )
+
+    def add_goal(self, goal):
+        goal_id = self.budget_goals.insert_one(goal).inserted_id
+        if goal.get("tracked"):
+            goal_progress.recompute_goals(self.db, [goal_id])
+        return str(goal_id)
+
+    def list_goals(self):
+        return list(self.budget_goals.find())
+
+    def get_goal(self, goal_id):
+        return self.budget_goals.find_one({"_id": ObjectId(goal_id)})
+
+    def update_goal(self, goal_id, fields):
+        updated = self.budget_goals.update_one({"_id": ObjectId(goal_id)}, {"$set": fields}).matched_count > 0
+        if updated and set(fields) & set(goal_progress.TRACK_FIELDS):
+            goal_progress.recompute_goals(self.db, [ObjectId(goal_id)])
+        return updated
+
+    def delete_goals(self, goal_ids):
+        return self.budget_goals.delete_many({"_id": {"$in": [ObjectId(i) for i in goal_ids]}}).deleted_count
+
+    def count_goals(self, goal_ids):
+        return self.budget_goals.count_documents({"_id": {"$in": [ObjectId(i) for i in goal_ids]}})
+
+    def recompute_goal_progress(self, goal_ids=None):
+        return goal_progress.recompute_goals(self.db, None if goal_ids is None else [ObjectId(i) for i in goal_ids])
+
+    # Sends a JSON command to a microservice; error replies raise ValueError
+    @staticmethod
+    def _request(service, message, **kwargs):
+        import zmq_client
+        try:
+            reply = zmq_client.get_client(service).request_json(message, **kwargs)
+        except zmq_client.ServiceUnavailable as e:
+            raise zmq_client.ServiceUnavailable(f"Microservice {service} is not responding: {e}") from e
+        if reply.get("status") != "ok":
+            raise ValueError(reply.get("message"))
+        return reply
+
+    # Sends one request to Microservice A and returns (header, response)
+    @staticmethod
+    def _request_a(request):
+        import wire
+        import zmq_client
+        try:
+            frames = zmq_client.get_client("A").request([json.dumps(request).encode()])
+        except zmq_client.ServiceUnavailable as e:
+            raise zmq_client.ServiceUnavailable(f"Microservice A is not responding: {e}") from e
+        if len(frames) == 1:
+            return {}, json.loads(frames[0])
+        header, resp = wire.decode(*frames)
+        if header.get("format") == "columns":
+            resp = wire.from_columns(resp)
+        return header, resp
+
+    # Asks for a compact encoding and chunks, so the first rows can be shown straight away
+    def filter_transactions(self, request):
+        import wire
+        request = {**request, "accept": wire.accept_header(), "chunk_size": FILTER_CHUNK_SIZE}
+        while True:
+            header, resp = self._request_a(request)
+            yield resp
+            if not header.get("next"):
+                return
+            request["after"] = header["next"]
+
+    # Totals and newest transactions in one Microservice A batch round trip
+    def transaction_summary(self, limit):
+        import wire
+        _, resp = self._request_a({"batch": [{"totals": True}, {"recent": limit}], "accept": wire.accept_header()})
+        if resp.get("error"):
+            raise ValueError(resp["error"])
+        totals, recent = [r["result"] for r in resp["results"]]
+        return totals, recent
+
+    # Returns the number of transactions posted right away
+    def add_recurring_rule(self, rule):
+        # Only one attempt so a slow reply never adds the rule twice
+        return self._request("B", {"command": "add_recurring", "transaction": rule}, attempts=1)["processed_count"]
+
+    def apply_recurring(self):
+        return self._request("B", {"command": "apply_recurring"})["processed_count"]
+
+    # Builds Microservice D's optional date range fields
+    @staticmethod
+    def _date_range(date_from, date_to):
+        return {field: day for field, day in (("from", date_from), ("to", date_to)) if day}
+
+    def savings_totals(self, date_from=None, date_to=None):
+        reply = self._request("D", {"command": "totals", **self._date_range(date_from, date_to)})
+        return {"total": reply["total"], "count": reply["count"]}
+
+    def savings_by_month(self, date_from=None, date_to=None):
+        return self._request("D", {"command": "monthly", **self._date_range(date_from, date_to)})["months"]
+
+    def savings_entries(self, date_from=None, date_to=None, after=None, page_size=20):
+        reply = self._request("D", {
+            "command": "entries", "after": after, "page_size": page_size, **self._date_range(date_from, date_to),
+        })
+        return reply["entries"], reply["next"]
+
+    # Returns (status, etag, body) from Microservice C; the image is only resent if etag is stale
+    def chart(self, chart, etag=None):
+        import zmq_client
+        request = {"command": "generate_chart", "chart": chart, "etag": etag}
+        try:
+            reply = zmq_client.get_client("C").request([json.dumps(request).encode()])
+        except zmq_client.ServiceUnavailable as e:
+            raise zmq_client.ServiceUnavailable(f"Microservice C is not responding: {e}") from e
+        # Charts come back as (status, etag, image); anything else is a one-frame error
+        if len(reply) != 3:
+            raise ValueError(f"Microservice C could not draw the chart: {b''.join(reply).decode(errors='replace')}")
+        status, etag, body = reply
+        return status.decode(), etag.decode(), body
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    type TEXT,
+    description TEXT,
+    category TEXT,
+    amount REAL NOT NULL DEFAULT 0,
+    recurring_key TEXT UNIQUE,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_date ON transactions (date, id);
+CREATE INDEX IF NOT EXISTS transactions_type_date ON transactions (type, date);
+CREATE INDEX IF NOT EXISTS transactions_category ON transactions (category);
+
+CREATE TABLE IF NOT EXISTS budget_goals (
+    id TEXT PRIMARY KEY,
+    goal_name TEXT,
+    target_amount REAL NOT NULL DEFAULT 0,
+    current_amount REAL NOT NULL DEFAULT 0,
+    tracked INTEGER NOT NULL DEFAULT 0,
+    direction INTEGER NOT NULL DEFAULT 1,
+    category TEXT,
+    type TEXT,
+    date_from TEXT,
+    date_to TEXT
+);
+
+CREATE TABLE IF NOT EXISTS recurring_rules (
+    id TEXT PRIMARY KEY,
+    description TEXT,
+    amount REAL NOT NULL DEFAULT 0,
+    category TEXT,
+    type TEXT,
+    frequency TEXT NOT NULL,
+    next_due TEXT NOT NULL,
+    anchor_day INTEGER
+);
+CREATE INDEX IF NOT EXISTS recurring_rules_next_due ON recurring_rules (next_due);
+
+CREATE TABLE IF NOT EXISTS export_state (
+    id TEXT PRIMARY KEY,
+    last_id TEXT,
+    exported_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS ledger_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO ledger_counters (name, value) VALUES ('transaction_deletes', 0);
+"""
+
+# Columns added after a table was first created: (table, column, definition)
+MIGRATIONS = [
+    ("transactions", "updated_at", "TEXT"),
+    ("budget_goals", "tracked", "INTEGER NOT NULL DEFAULT 0"),
+    ("budget_goals", "direction", "INTEGER NOT NULL DEFAULT 1"),
+    ("budget_goals", "category", "TEXT"),
+    ("budget_goals", "type", "TEXT"),
+    ("budget_goals", "date_from", "TEXT"),
+    ("budget_goals", "date_to", "TEXT"),
+]
+
+# Tracked goals a transaction row ({row} is NEW or OLD) counts towards
+GOAL_MATCH = """tracked = 1
+        AND (category IS NULL OR category = {row}.category)
+        AND (type IS NULL OR type = {row}.type)
+        AND (date_from IS NULL OR date_from <= {row}.date)
+        AND (date_to IS NULL OR date_to >= {row}.date)"""
+
+# Goal progress deltas and the delete counter, applied by SQLite on every transaction write
+MIGRATED_SCHEMA = f"""
+CREATE INDEX IF NOT EXISTS transactions_updated_at ON transactions (updated_at);
+
+CREATE TRIGGER IF NOT EXISTS transactions_deleted AFTER DELETE ON transactions BEGIN
+    UPDATE ledger_counters SET value = value + 1 WHERE name = 'transaction_deletes';
+END;
+
+CREATE TRIGGER IF NOT EXISTS goal_progress_insert AFTER INSERT ON transactions BEGIN
+    UPDATE budget_goals SET current_amount = current_amount + direction * NEW.amount
+    WHERE {GOAL_MATCH.format(row="NEW")};
+END;
+
+CREATE TRIGGER IF NOT EXISTS goal_progress_delete AFTER DELETE ON transactions BEGIN
+    UPDATE budget_goals SET current_amount = current_amount - direction * OLD.amount
+    WHERE {GOAL_MATCH.format(row="OLD")};
+END;
+
+CREATE TRIGGER IF NOT EXISTS goal_progress_update AFTER UPDATE OF date, type, category, amount ON transactions BEGIN
+    UPDATE budget_goals SET current_amount = current_amount - direction * OLD.amount
+    WHERE {GOAL_MATCH.format(row="OLD")};
+    UPDATE budget_goals SET current_amount = current_amount + direction * NEW.amount
+    WHERE {GOAL_MATCH.format(row="NEW")};
+END;
+"""
+
+
+class SQLiteRepository(Repository):
+    """
+    Repository over an embedded SQLite database. One connection, guarded by a
+    lock, is shared by every caller in the process.
+    """
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.RLock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+            self._migrate()
+        # Counts this connection's writes, which data_version does not see
+        self.writes = 0
+
+    # Adds columns that files created by older versions are missing
+    def _migrate(self):
+        for table, column, definition in MIGRATIONS:
+            existing = {row["name"] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        self.conn.executescript(MIGRATED_SCHEMA)
+
+    # Converts the neutral filter format to a WHERE clause and its parameters
+    def where(self, filters):
+        clauses, params = [], []
+        if filters.get("ids") is not None:
+            ids = list(filters["ids"])
+            clauses.append(f"id IN ({', '.join('?' * len(ids))})" if ids else "0")
+            params.extend(ids)
+        if filters.get("month"):
+            start, end = month_range(filters["month"])
+            clauses.append("date >= ? AND date < ?")
+            params.extend([start, end])
+        for field in ("type", "category"):
+            if filters.get(field):
+                clauses.append(f"{field} = ?")
+                params.append(filters[field])
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _write(self, sql, params=()):
+        with self.lock, self.conn:
+            self.writes += 1
+            return self.conn.execute(sql, params).rowcount
+
+    @staticmethod
+    def _transaction(row):
+        return {"_id": row["id"], **{field: row[field] for field in TRANSACTION_FIELDS}, "updated_at": row["updated_at"]}
+
+    @staticmethod
+    def _goal(row):
+        goal = {"_id": row["id"], **{field: row[field] for field in GOAL_FIELDS}}
+        goal["tracked"] = bool(goal["tracked"])
+        return goal
+
+    @staticmethod
+    def _columns(fields, allowed):
+        unknown = set(fields) - set(allowed)
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(sorted(unknown))}")
+        return ", ".join(f"{field} = ?" for field in fields)
+
+    def add_transaction(self, transaction):
+        transaction_id = str(ObjectId())
+        transaction["updated_at"] = updated_now().isoformat(timespec="microseconds")
+        self._write(
+            "INSERT INTO transactions (id, date, type, description, category, amount, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [transaction_id] + [transaction.get(field) for field in TRANSACTION_FIELDS] + [transaction["updated_at"]],
+        )
+        transaction["_id"] = transaction_id
+        return transaction_id
+
+    def get_transaction(self, transaction_id):
+        rows = self._query("SELECT * FROM transactions WHERE id = ?", (transaction_id,))
+        return self._transaction(rows[0]) if rows else None
+
+    def update_transaction(self, transaction_id, fields):
+        columns = self._columns(fields, TRANSACTION_FIELDS)
+        return self._write(
+            f"UPDATE transactions SET {columns}, updated_at = ? WHERE id = ?",
+            list(fields.values()) + [updated_now().isoformat(timespec="microseconds"), transaction_id],
+        ) > 0
+
+    def delete_transaction(self, transaction_id):
+        return self._write("DELETE FROM transactions WHERE id = ?", (transaction_id,)) > 0
+
+    def find_transactions(self, filters):
+        where, params = self.where(filters)
+        return [self._transaction(r) for r in self._query(f"SELECT * FROM transactions{where} ORDER BY date, id", params)]
+
+    def count_transactions(self, filters):
+        where, params = self.where(filters)
+        return self._query(f"SELECT COUNT(*) FROM transactions{where}", params)[0][0]
+
+    def delete_transactions(self, filters):
+        where, params = self.where(filters)
+        return self._write(f"DELETE FROM transactions{where}", params)
+
+    def recent_transactions(self, limit):
+        rows = self._query("SELECT * FROM transactions ORDER BY date DESC, id DESC LIMIT ?", (limit,))
+        return [self._transaction(r) for r in rows]
+
+    # Same keyset walk as the Mongo pager, over the (date, id) index
+    def transaction_page(self, row, op, newest_first, limit):
+        where, params = "", []
+        if row:
+            strict = ">" if op == "$gt" else "<"
+            comparison = {"$lt": "<", "$lte": "<=", "$gt": ">"}[op]
+            where = f" WHERE date {strict} ? OR (date = ? AND id {comparison} ?)"
+            params = [row["date"], row["date"], row["_id"]]
+        direction = "DESC" if newest_first else "ASC"
+        rows = self._query(
+            f"SELECT * FROM transactions{where} ORDER BY date {direction}, id {direction} LIMIT ?", params + [limit]
+        )
+        return [self._transaction(r) for r in rows]
+
+    def iter_transactions(self, after_id=None, batch_size=1000):
+        while True:
+            if after_id is None:
+                rows = self._query("SELECT * FROM transactions ORDER BY id LIMIT ?", (batch_size,))
+            else:
+                rows = self._query("SELECT * FROM transactions WHERE id > ? ORDER BY id LIMIT ?", (after_id, batch_size))
+            for row in rows:
+                yield self._transaction(row)
+            if len(rows) < batch_size:
+                return
+            after_id = rows[-1]["id"]
+
+    def totals(self):
+        row = self._query(
+            "SELECT COALESCE(SUM(CASE WHEN amount >= 0 THEN amount ELSE 0 END), 0),"
+            " COALESCE(SUM(CASE WHEN amount < 0 THEN amount ELSE 0 END), 0),"
+            " COALESCE(SUM(amount), 0), COUNT(*) FROM transactions"
+        )[0]
+        return {"income": row[0], "expenses": row[1], "net": row[2], "count": row[3]}
+
+    def changed_transactions(self, since=None, after_id=None):
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("updated_at >= ?")
+            params.append(since)
+        if after_id is not None:
+            clauses.append("id > ?")
+            params.append(after_id)
+        where = " WHERE " + " OR ".join(clauses) if clauses else ""
+        return [self._transaction(r) for r in self._query(f"SELECT * FROM transactions{where} ORDER BY id", params)]
+
+    # data_version changes when another connection commits; writes counts this one's
+    def transactions_version(self):
+        return self._query("PRAGMA data_version")[0][0], self.writes
+
+    # Counted by a trigger, so deletes from any connection to the file show up
+    def transactions_deleted(self):
+        return self._query("SELECT value FROM ledger_counters WHERE name = 'transaction_deletes'")[0][0]
+
+    def get_export_state(self, state_id):
+        rows = self._query("SELECT last_id FROM export_state WHERE id = ?", (state_id,))
+        return rows[0]["last_id"] if rows else None
+
+    def set_export_state(self, state_id, last_id):
+        self._write(
+            "INSERT INTO export_state (id, last_id, exported_at) VALUES (?, ?, ?)"
+            " ON CONFLICT (id) DO UPDATE SET last_id = excluded.last_id, exported_at = excluded.exported_at",
+            (state_id, last_id, datetime.now().isoformat()),
+        )
+
+    def add_goal(self, goal):
+        goal_id = str(ObjectId())
+        goal = {"current_amount": 0, "tracked": False, "direction": 1, **goal}
+        self._write(
+            f"INSERT INTO budget_goals (id, {', '.join(GOAL_FIELDS)}) VALUES (?{', ?' * len(GOAL_FIELDS)})",
+            [goal_id] + [goal.get(field) for field in GOAL_FIELDS],
+        )
+        if goal["tracked"]:
+            self.recompute_goal_progress([goal_id])
+        return goal_id
+
+    def list_goals(self):
+        return [self._goal(r) for r in self._query("SELECT * FROM budget_goals ORDER BY id")]
+
+    def get_goal(self, goal_id):
+        rows = self._query("SELECT * FROM budget_goals WHERE id = ?", (goal_id,))
+        return self._goal(rows[0]) if rows else None
+
+    def update_goal(self, goal_id, fields):
+        columns = self._columns(fields, GOAL_FIELDS)
+        updated = self._write(f"UPDATE budget_goals SET {columns} WHERE id = ?", list(fields.values()) + [goal_id]) > 0
+        if updated and set(fields) & set(goal_progress.TRACK_FIELDS):
+            self.recompute_goal_progress([goal_id])
+        return updated
+
+    def delete_goals(self, goal_ids):
+        goal_ids = list(goal_ids)
+        if not goal_ids:
+            return 0
+        return self._write(f"DELETE FROM budget_goals WHERE id IN ({', '.join('?' * len(goal_ids))})", goal_ids)
+
+    def count_goals(self, goal_ids):
+        goal_ids = list(goal_ids)
+        if not goal_ids:
+            return 0
+        return self._query(
+            f"SELECT COUNT(*) FROM budget_goals WHERE id IN ({', '.join('?' * len(goal_ids))})", goal_ids
+        )[0][0]
+
+    # Recomputes tracked goals from the ledger with one correlated UPDATE
+    def recompute_goal_progress(self, goal_ids=None):
+        where, params = "tracked = 1", []
+        if goal_ids is not None:
+            goal_ids = list(goal_ids)
+            where += f" AND id IN ({', '.join('?' * len(goal_ids))})" if goal_ids else " AND 0"
+            params = goal_ids
+        return self._write(
+            "UPDATE budget_goals SET current_amount = direction * ("
+            " SELECT COALESCE(SUM(t.amount), 0) FROM transactions t"
+            " WHERE (budget_goals.category IS NULL OR t.category = budget_goals.category)"
+            " AND (budget_goals.type IS NULL OR t.type = budget_goals.type)"
+            " AND (budget_goals.date_from IS NULL OR t.date >= budget_goals.date_from)"
+            " AND (budget_goals.date_to IS NULL OR t.date <= budget_goals.date_to)"
+            f") WHERE {where}", params
+        )
+
+    # Stores a new recurring rule and posts it right away when it is already due
+    def add_recurring_rule(self, rule):
+        """
+        Same rules as Microservice B's add_recurring. Returns the number of
+        transactions posted.
+        """
+        recurrence = rule.setdefault("recurrence", {})
+        frequency = recurrence.get("frequency")
+        validate_frequency(frequency)
+        start = datetime.strptime(recurrence.get("next_due", ""), "%Y-%m-%d").date()
+        start = first_occurrence(start, frequency)
+        recurrence["next_due"] = str(start)
+        recurrence["anchor_day"] = start.day
+
+        rule_id = self.insert_recurring_rule(rule)
+        if start <= datetime.today().date():
+            return len(self._apply_due([rule_id]))
+        return 0
+
+    # Catches up every due rule; returns the number of transactions posted
+    def apply_recurring(self):
+        return len(self._apply_due())
+
+    # Posts every missed occurrence of each due rule and moves its next_due past today
+    def _apply_due(self, rule_ids=None):
+        """
+        Same catch-up rules as Microservice B. Returns the posted transactions.
+        """
+        today = datetime.today().date()
+        pending = []
+        advances = []
+        for rule in self.due_recurring_rules(str(today), rule_ids):
+            recurrence = rule.get("recurrence", {})
+            try:
+                next_due = datetime.strptime(recurrence.get("next_due", ""), "%Y-%m-%d").date()
+                occurrences, due = expand_occurrences(
+                    next_due, recurrence.get("frequency"), today, recurrence.get("anchor_day")
+                )
+            except ValueError:
+                continue
+            pending.extend(build_transaction(rule, occurrence) for occurrence in occurrences)
+            advances.append((rule["_id"], recurrence["next_due"], str(due)))
+        if not pending:
+            return []
+        # Posted first so a failure leaves the rules due and the next run retries them
+        posted = self.add_transactions(pending)
+        for rule_id, old_due, new_due in advances:
+            self.advance_recurring_rule(rule_id, old_due, new_due)
+        return posted
+
+    def insert_recurring_rule(self, rule):
+        rule_id = str(ObjectId())
+        recurrence = rule["recurrence"]
+        self._write(
+            "INSERT INTO recurring_rules (id, description, amount, category, type, frequency, next_due, anchor_day)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (rule_id, rule.get("description"), rule.get("amount", 0), rule.get("category"), rule.get("type"),
+             recurrence["frequency"], recurrence["next_due"], recurrence.get("anchor_day")),
+        )
+        return rule_id
+
+    def due_recurring_rules(self, today, rule_ids=None):
+        sql, params = "SELECT * FROM recurring_rules WHERE next_due <= ?", [today]
+        if rule_ids is not None:
+            rule_ids = list(rule_ids)
+            sql += f" AND id IN ({', '.join('?' * len(rule_ids))})" if rule_ids else " AND 0"
+            params.extend(rule_ids)
+        return [
+            {
+                "_id": r["id"],
+                "description": r["description"],
+                "amount": r["amount"],
+                "category": r["category"],
+                "type": r["type"],
+                "recurrence": {"frequency": r["frequency"], "next_due": r["next_due"], "anchor_day": r["anchor_day"]},
+            }
+            for r in self._query(sql, params)
+        ]
+
+    def advance_recurring_rule(self, rule_id, old_due, new_due):
+        self._write(
+            "UPDATE recurring_rules SET next_due = ? WHERE id = ? AND next_due = ?", (new_due, rule_id, old_due)
+        )
+
+    # Inserts transactions in one SQLite transaction, skipping recurring_keys already posted
+    def add_transactions(self, transactions):
+        inserted = []
+        stamp = updated_now().isoformat(timespec="microseconds")
+        with self.lock, self.conn:
+            self.writes += 1
+            for transaction in transactions:
+                transaction_id = str(ObjectId())
+                transaction["updated_at"] = stamp
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO transactions"
+                    " (id, date, type, description, category, amount, recurring_key, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [transaction_id] + [transaction.get(field) for field in TRANSACTION_FIELDS]
+                    + [transaction.get("recurring_key"), stamp],
+                )
+                if cursor.rowcount:
+                    transaction["_id"] = transaction_id
+                    inserted.append(transaction)
+        return inserted
+
+    # WHERE clause on savings transactions; bad dates raise ValueError like Microservice D
+    @staticmethod
+    def _savings_where(date_from, date_to):
+        for day in (date_from, date_to):
+            if day:
+                datetime.strptime(day, "%Y-%m-%d")
+        sql, params = " WHERE type = 'savings'", []
+        if date_from:
+            sql += " AND date >= ?"
+            params.append(date_from)
+        if date_to:
+            sql += " AND date <= ?"
+            params.append(date_to)
+        return sql, params
+
+    def savings_totals(self, date_from=None, date_to=None):
+        where, params = self._savings_where(date_from, date_to)
+        row = self._query(f"SELECT COALESCE(SUM(amount), 0), COUNT(*) FROM transactions{where}", params)[0]
+        return {"total": row[0], "count": row[1]}
+
+    def savings_by_month(self, date_from=None, date_to=None):
+        where, params = self._savings_where(date_from, date_to)
+        rows = self._query(
+            f"SELECT substr(date, 1, 7) AS month, SUM(amount), COUNT(*) FROM transactions{where}"
+            " GROUP BY month ORDER BY month", params
+        )
+        return [{"month": r[0], "total": r[1], "count": r[2]} for r in rows]
+
+    def savings_entries(self, date_from=None, date_to=None, after=None, page_size=20):
+        # SQLite treats a negative LIMIT as no limit
+        page_size = max(1, page_size)
+        where, params = self._savings_where(date_from, date_to)
+        if after:
+            where += " AND (date > ? OR (date = ? AND id > ?))"
+            params.extend([after["date"], after["date"], after["id"]])
+        rows = self._query(
+            f"SELECT id, date, amount FROM transactions{where} ORDER BY date, id LIMIT ?", params + [page_size + 1]
+        )
+        next_token = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_token = {"date": rows[-1]["date"], "id": rows[-1]["id"]}
+        return [{"id": r["id"], "date": r["date"], "amount": r["amount"]} for r in rows], next_token
+
+    # Income/expense/net/count per group, in the format of rollups.rollup_summary
+    def rollup_summary(self, group_by=()):
+        columns = {"month": "substr(date, 1, 7)", "type": "type", "category": "category"}
+        select = "".join(f"{columns[field]} AS {field}, " for field in group_by)
+        grouping = f" GROUP BY {', '.join(group_by)} ORDER BY {', '.join(group_by)}" if group_by else ""
+        rows = self._query(
+            f"SELECT {select}COALESCE(SUM(CASE WHEN amount >= 0 THEN amount ELSE 0 END), 0) AS income,"
+            " COALESCE(SUM(CASE WHEN amount < 0 THEN amount ELSE 0 END), 0) AS expenses,"
+            f" COALESCE(SUM(amount), 0) AS net, COUNT(*) AS count FROM transactions{grouping}"
+        )
+        return [
+            {"group": {field: r[field] for field in group_by}, **{f: r[f] for f in ("income", "expenses", "net", "count")}}
+            for r in rows if r["count"]
+        ]
+
+    # Draws the chart in this process with Microservice C's chart code
+    def chart(self, chart, etag=None):
+        import microserviceC
+        return microserviceC.generate_chart(None, chart, etag, summary=self.rollup_summary)
+
+
+# Time stamped on transaction writes
+def updated_now():
+    return datetime.now(timezone.utc)
+
+# Returns the repository picked by BUDGETWISE_STORAGE, created once per process
+def get_repository():
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            # db_connection loads .env and only connects when asked
+            import db_connection
+            backend = db_connection.storage_backend()
+            if backend == "sqlite":
+                _repository = SQLiteRepository(os.getenv("BUDGETWISE_SQLITE_PATH", DEFAULT_SQLITE_PATH))
+            elif backend == "mongo":
+                _repository = MongoRepository(db_connection.get_db())
+            else:
+                raise ValueError(f"Unknown BUDGETWISE_STORAGE '{backend}'. Use mongo or sqlite.")
+    return _repository
@@ -0,0 +1,10 @@
+import pytest
+
+import rollups
+
+
+@pytest.fixture
+def mongo_db():
+    mongomock = pytest.importorskip("mongomock")
+    rollups._built.clear()
+    return mongomock.MongoClient()["budgetwise_db"]
@@ -0,0 +1,34 @@
+import numpy as np
+
+from analytics import Ledger, parse_days
+
+
+def test_parse_days():
+    days, keep = parse_days(["1970-01-02", "2024-02-29"])
+    assert days.tolist() == [1, 19782]
+    assert keep.tolist() == [True, True]
+
+
+def test_parse_days_skips_empty_dates():
+    days, keep = parse_days(["2024-01-01", "", "NaT"])
+    assert keep.tolist() == [True, False, False]
+    assert days[0] == 19723
+
+
+def test_parse_days_skips_bad_dates():
+    days, keep = parse_days(["2024-01-01", "not a date", "2024-13-01", "2024-01-31T10:00"])
+    assert keep.tolist() == [True, False, False, True]
+    assert days[keep].tolist() == [19723, 19753]
+
+
+def test_rows_with_bad_dates_are_left_out():
+    ledger = Ledger.from_rows([
+        {"_id": 1, "date": "2024-01-05", "type": "expense", "category": "food", "amount": -10},
+        {"_id": 2, "date": "", "type": "expense", "category": "food", "amount": -99},
+        {"_id": 3, "type": "income", "category": "job", "amount": 500},
+        {"_id": 4, "date": "2024-02-01", "type": "income", "category": "job", "amount": 100},
+    ])
+    assert len(ledger) == 2
+    months, net = ledger.monthly_net()
+    assert months == ["2024-01", "2024-02"]
+    assert np.allclose(net, [-10, 100])
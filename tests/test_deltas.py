@@ -0,0 +1,96 @@
+"""
+The rollup and goal progress deltas applied on writes must always match a
+rebuild from the ledger.
+"""
+import pytest
+
+import goal_progress
+import rollups
+from storage import MongoRepository
+
+
+def rollup_rows(db):
+    return sorted(
+        ((r["_id"]["month"], r["_id"]["type"], r["_id"]["category"]),
+         (r["income"], r["expenses"], r["net"], r["count"]))
+        for r in db[rollups.ROLLUP_COLLECTION].find() if r["count"]
+    )
+
+
+def goal_amounts(db):
+    return {str(g["_id"]): g["current_amount"] for g in db.budget_goals.find()}
+
+
+@pytest.fixture
+def repo(mongo_db):
+    repo = MongoRepository(mongo_db)
+    repo.totals()  # builds the (empty) rollups and stores the marker
+    repo.add_goal({"goal_name": "food", "target_amount": 500, "current_amount": 0,
+                   "tracked": True, "direction": -1, "category": "food"})
+    repo.add_goal({"goal_name": "january", "target_amount": 1000, "current_amount": 0,
+                   "tracked": True, "direction": 1, "date_from": "2024-01-01", "date_to": "2024-01-31"})
+    repo.add_goal({"goal_name": "manual", "target_amount": 100, "current_amount": 40})
+    return repo
+
+
+def add_ledger(repo):
+    ids = []
+    for day, txn_type, category, amount in [
+        ("2024-01-05", "expense", "food", -20),
+        ("2024-01-09", "expense", "food", -35.5),
+        ("2024-01-15", "income", "job", 1200),
+        ("2024-01-31", "expense", "rent", -800),
+        ("2024-02-02", "expense", "food", -12),
+        ("2024-02-10", "savings", "bank", 50),
+    ]:
+        ids.append(repo.add_transaction(
+            {"date": day, "type": txn_type, "description": "", "category": category, "amount": amount}
+        ))
+    return ids
+
+
+def assert_matches_rebuild(db):
+    rows, amounts = rollup_rows(db), goal_amounts(db)
+    rollups.rebuild_rollups(db)
+    goal_progress.recompute_goals(db)
+    assert rows == rollup_rows(db)
+    assert amounts == goal_amounts(db)
+
+
+def test_insert(repo):
+    add_ledger(repo)
+    assert repo.totals()["net"] == pytest.approx(382.5)
+    goals = {g["goal_name"]: g["current_amount"] for g in repo.list_goals()}
+    assert goals == {"food": pytest.approx(67.5), "january": pytest.approx(344.5), "manual": 40}
+    assert_matches_rebuild(repo.db)
+
+
+def test_update(repo):
+    ids = add_ledger(repo)
+    # Moves between months, categories and in and out of a goal's window
+    repo.update_transaction(ids[0], {"date": "2024-02-20", "amount": -25})
+    repo.update_transaction(ids[4], {"category": "rent"})
+    repo.update_transaction(ids[2], {"amount": 1300})
+    assert_matches_rebuild(repo.db)
+
+
+def test_delete(repo):
+    ids = add_ledger(repo)
+    repo.delete_transaction(ids[1])
+    assert_matches_rebuild(repo.db)
+
+
+def test_bulk_delete(repo):
+    add_ledger(repo)
+    assert repo.delete_transactions({"category": "food"}) == 3
+    assert_matches_rebuild(repo.db)
+    assert repo.delete_transactions({"month": "2024-01"}) == 2
+    assert_matches_rebuild(repo.db)
+    assert repo.totals()["count"] == 1
+
+
+def test_ledger_from_before_the_rollups_is_counted(mongo_db):
+    mongo_db.transactions.insert_one({"date": "2023-12-01", "type": "income", "category": "job", "amount": 300})
+    repo = MongoRepository(mongo_db)
+    repo.add_transaction({"date": "2024-01-01", "type": "expense", "category": "food", "amount": -5})
+    assert repo.totals()["net"] == 295
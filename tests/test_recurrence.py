@@ -0,0 +1,75 @@
+from datetime import date
+
+import pytest
+
+from recurrence import (add_months, end_of_month, expand_occurrences, first_occurrence,
+                        migrate_recurrence, next_occurrence, normalize_frequency, validate_frequency)
+
+
+@pytest.mark.parametrize("day, expected", [
+    (date(2024, 1, 15), date(2024, 1, 31)),
+    (date(2024, 2, 1), date(2024, 2, 29)),
+    (date(2023, 2, 28), date(2023, 2, 28)),
+    (date(2024, 4, 30), date(2024, 4, 30)),
+    (date(2024, 12, 5), date(2024, 12, 31)),
+])
+def test_end_of_month(day, expected):
+    assert end_of_month(day) == expected
+
+
+@pytest.mark.parametrize("day, months, anchor_day, expected", [
+    (date(2024, 1, 15), 1, 15, date(2024, 2, 15)),
+    (date(2024, 1, 31), 1, 31, date(2024, 2, 29)),
+    (date(2023, 1, 31), 1, 31, date(2023, 2, 28)),
+    (date(2024, 11, 30), 2, 30, date(2025, 1, 30)),
+    (date(2024, 2, 29), 12, 29, date(2025, 2, 28)),
+    # The anchor day comes back once the month is long enough
+    (date(2024, 2, 29), 1, 31, date(2024, 3, 31)),
+    (date(2024, 4, 30), 1, 31, date(2024, 5, 31)),
+])
+def test_add_months(day, months, anchor_day, expected):
+    assert add_months(day, months, anchor_day) == expected
+
+
+def test_monthly_rule_keeps_its_anchor_day():
+    occurrences, next_due = expand_occurrences(date(2024, 1, 31), "monthly", date(2024, 5, 31), 31)
+    assert [str(d) for d in occurrences] == ["2024-01-31", "2024-02-29", "2024-03-31", "2024-04-30", "2024-05-31"]
+    assert next_due == date(2024, 6, 30)
+
+
+def test_monthly_rule_without_anchor_drifts_to_the_short_month():
+    # Rules saved before anchor_day existed; migrate_recurrence backfills it
+    occurrences, _ = expand_occurrences(date(2024, 1, 31), "monthly", date(2024, 3, 31))
+    assert [str(d) for d in occurrences] == ["2024-01-31", "2024-02-29", "2024-03-29"]
+
+
+def test_end_of_month_rule():
+    first = first_occurrence(date(2024, 1, 10), "end-of-month")
+    assert first == date(2024, 1, 31)
+    assert next_occurrence(first, "end-of-month") == date(2024, 2, 29)
+    assert next_occurrence(date(2024, 2, 29), "end-of-month") == date(2024, 3, 31)
+
+
+def test_unknown_frequency_is_rejected():
+    with pytest.raises(ValueError):
+        validate_frequency("quarterly")
+
+
+@pytest.mark.parametrize("stored, expected", [
+    ("Monthly", ("monthly", True)),
+    (" biweekly ", ("bi-weekly", True)),
+    ("annually", ("yearly", True)),
+    ("quarterly", ("monthly", False)),
+    (None, ("monthly", False)),
+])
+def test_normalize_frequency(stored, expected):
+    assert normalize_frequency(stored) == expected
+
+
+def test_migrate_recurrence():
+    assert migrate_recurrence({"frequency": "monthly", "next_due": "2024-01-31"}) == {"anchor_day": 31}
+    assert migrate_recurrence({"frequency": "quarterly", "next_due": "2024-02-10"}) == {
+        "frequency": "monthly", "original_frequency": "quarterly", "anchor_day": 10,
+    }
+    assert migrate_recurrence({"frequency": "daily", "next_due": "2024-02-10"}) == {}
+    assert migrate_recurrence({"frequency": "monthly", "next_due": "2024-02-10", "anchor_day": 31}) == {}
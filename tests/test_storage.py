@@ -0,0 +1,135 @@
+"""
+MongoRepository and SQLiteRepository must answer the same calls the same way.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from storage import MongoRepository, SQLiteRepository
+from transaction_cache import TransactionCache
+
+LEDGER = [
+    ("2024-01-05", "expense", "lunch", "food", -20),
+    ("2024-01-05", "expense", "snacks", "food", -4.5),
+    ("2024-01-15", "income", "salary", "job", 1200),
+    ("2024-01-31", "expense", "rent", "rent", -800),
+    ("2024-02-02", "expense", "groceries", "food", -12),
+    ("2024-02-10", "savings", "transfer", "bank", 50),
+    ("2024-03-01", "income", "bonus", "job", 200),
+]
+
+
+@pytest.fixture(params=["mongo", "sqlite"])
+def repo(request):
+    if request.param == "sqlite":
+        return SQLiteRepository(":memory:")
+    db = request.getfixturevalue("mongo_db")
+    return MongoRepository(db)
+
+
+@pytest.fixture
+def ids(repo):
+    return [
+        repo.add_transaction({"date": d, "type": t, "description": s, "category": c, "amount": a})
+        for d, t, s, c, a in LEDGER
+    ]
+
+
+def plain(transactions):
+    return [(t["date"], t["type"], t["description"], t["category"], t["amount"]) for t in transactions]
+
+
+def test_ids_are_object_id_strings(repo, ids):
+    assert all(repo.is_valid_id(i) for i in ids)
+    assert not repo.is_valid_id("nope")
+
+
+def test_find_and_count(repo, ids):
+    assert plain(repo.find_transactions({})) == LEDGER
+    assert plain(repo.find_transactions({"month": "2024-01", "category": "food"})) == LEDGER[:2]
+    assert plain(repo.find_transactions({"ids": ids[2:4]})) == LEDGER[2:4]
+    assert repo.count_transactions({}) == len(LEDGER)
+    assert repo.count_transactions({"type": "income"}) == 2
+
+
+def test_totals(repo, ids):
+    assert repo.totals() == pytest.approx({"income": 1450, "expenses": -836.5, "net": 613.5, "count": 7})
+
+
+def test_update_and_delete(repo, ids):
+    assert repo.update_transaction(ids[0], {"amount": -25, "category": "dining"})
+    assert plain([repo.get_transaction(ids[0])]) == [("2024-01-05", "expense", "lunch", "dining", -25)]
+    assert repo.delete_transaction(ids[1])
+    assert not repo.delete_transaction(ids[1])
+    assert repo.get_transaction(ids[1]) is None
+    assert repo.delete_transactions({"type": "income"}) == 2
+    assert repo.totals() == pytest.approx({"income": 50, "expenses": -837, "net": -787, "count": 4})
+
+
+def test_pages(repo, ids):
+    newest = repo.transaction_page(None, None, True, 3)
+    assert plain(newest) == LEDGER[::-1][:3]
+    older = repo.transaction_page(newest[-1], "$lt", True, 3)
+    assert plain(older) == LEDGER[::-1][3:6]
+    assert plain(repo.transaction_page(older[-1], "$gt", False, 10)) == LEDGER[2:]
+    assert plain(repo.recent_transactions(2)) == LEDGER[::-1][:2]
+    assert plain(repo.iter_transactions(batch_size=2)) == LEDGER
+
+
+def test_tracked_goals(repo, ids):
+    goal_id = repo.add_goal({"goal_name": "food", "target_amount": 100, "current_amount": 0,
+                             "tracked": True, "direction": -1, "category": "food"})
+    assert repo.get_goal(goal_id)["current_amount"] == pytest.approx(36.5)
+    repo.add_transaction({"date": "2024-03-02", "type": "expense", "description": "", "category": "food", "amount": -10})
+    repo.delete_transactions({"month": "2024-02"})
+    assert repo.get_goal(goal_id)["current_amount"] == pytest.approx(34.5)
+    repo.update_goal(goal_id, {"date_from": "2024-03-01"})
+    assert repo.get_goal(goal_id)["current_amount"] == pytest.approx(10)
+
+
+def test_cache_matches_repository(repo, ids):
+    cache = TransactionCache(repo)
+    cache.load()
+    cache.update_transaction(ids[0], {"amount": -30})
+    cache.delete_transaction(ids[1])
+    # Writes made behind the cache's back
+    repo.add_transaction({"date": "2024-03-05", "type": "expense", "description": "", "category": "food", "amount": -3})
+    repo.update_transaction(ids[2], {"amount": 1250})
+    repo.delete_transaction(ids[3])
+    cache.refresh()
+    assert plain(cache.find_transactions({})) == plain(repo.find_transactions({}))
+    assert cache.totals() == pytest.approx(repo.totals())
+
+
+def test_sqlite_recurring_rules_catch_up_once():
+    repo = SQLiteRepository(":memory:")
+    start = date.today() - timedelta(days=20)
+    assert repo.add_recurring_rule({"description": "gym", "amount": 5, "category": "health", "type": "expense",
+                                    "recurrence": {"frequency": "weekly", "next_due": str(start)}}) == 3
+    assert repo.apply_recurring() == 0
+    posted = repo.find_transactions({"category": "health"})
+    assert sorted(t["date"] for t in posted) == [str(start + timedelta(days=7 * i)) for i in range(3)]
+    assert all(t["amount"] == -5 for t in posted)
+
+
+@pytest.mark.parametrize("backend", ["mongo", "sqlite"])
+def test_cache_sees_deletes_from_another_connection(backend, request, tmp_path):
+    if backend == "sqlite":
+        path = str(tmp_path / "ledger.db")
+        repo, other = SQLiteRepository(path), SQLiteRepository(path)
+    else:
+        db = request.getfixturevalue("mongo_db")
+        repo, other = MongoRepository(db), MongoRepository(db)
+    ids = [repo.add_transaction({"date": d, "type": t, "description": s, "category": c, "amount": a})
+           for d, t, s, c, a in LEDGER]
+    cache = TransactionCache(repo)
+    cache.load()
+    cache.delete_transaction(ids[0])
+    # A delete and an insert elsewhere leave the count unchanged
+    other.delete_transaction(ids[1])
+    other.add_transaction({"date": "2024-03-05", "type": "expense", "description": "", "category": "food", "amount": -3})
+    assert other.transactions_deleted() == 2
+    cache.refresh()
+    assert cache.get_transaction(ids[1]) is None
+    assert plain(cache.find_transactions({})) == plain(repo.find_transactions({}))
+    assert cache.totals() == pytest.approx(repo.totals())
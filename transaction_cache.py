@@ -0,0 +1,198 @@
+"""
+Session transaction cache
+
+Keeps the transactions in memory for a budget_app session so menu redraws,
+edits, counts and totals stop going back to the database:
+  - the ledger is loaded once, with the pager's projection
+  - adds, edits and deletes write through to the repository, then to the cache
+  - refresh() first compares the repository's transactions_version(); only when
+    it moved are the documents stamped at or after the updated_at watermark, or
+    inserted past the _id watermark, fetched and merged. Deletes leave nothing
+    to fetch, so the cache also counts its own deletes and reloads when the
+    repository's transactions_deleted() counter says someone else deleted.
+
+Pages are served from a sorted (date, _id) index with the same transaction_page()
+interface as the repositories, so TransactionPager works on either.
+"""
+from bisect import bisect_left, bisect_right, insort
+
+from budget_summary import month_range
+from storage import PROJECTION
+
+FIELDS = ("_id",) + tuple(PROJECTION) + ("updated_at",)
+
+
+# Sort key of a transaction in the page index
+def page_key(transaction):
+    return str(transaction.get("date") or ""), transaction["_id"]
+
+# Builds a predicate for the repository filter format
+def matcher(filters):
+    ids = set(filters["ids"]) if filters.get("ids") is not None else None
+    start, end = month_range(filters["month"]) if filters.get("month") else (None, None)
+    fields = {field: filters[field] for field in ("type", "category") if filters.get(field)}
+
+    def matches(transaction):
+        if ids is not None and transaction["_id"] not in ids:
+            return False
+        if start is not None and not start <= str(transaction.get("date") or "") < end:
+            return False
+        return all(transaction.get(field) == value for field, value in fields.items())
+    return matches
+
+
+class TransactionCache:
+    """
+    Write-through cache of one repository's transactions.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.rows = {}
+        self.keys = []
+        self.sums = {"income": 0, "expenses": 0, "net": 0, "count": 0}
+        self.since = None
+        self.after_id = None
+        self.version = None
+        self.deleted = 0
+        self.loaded = False
+
+    # Adds or replaces a transaction in the rows, the page index and the totals
+    def _put(self, transaction, index=True):
+        transaction = {field: transaction[field] for field in FIELDS if field in transaction}
+        transaction["_id"] = str(transaction["_id"])
+        self._remove(transaction["_id"])
+        self.rows[transaction["_id"]] = transaction
+        if index:
+            insort(self.keys, page_key(transaction))
+        self._count(transaction, 1)
+        return transaction
+
+    # Drops a transaction; returns False if it was not cached
+    def _remove(self, transaction_id):
+        old = self.rows.pop(transaction_id, None)
+        if old is None:
+            return False
+        del self.keys[bisect_left(self.keys, page_key(old))]
+        self._count(old, -1)
+        return True
+
+    # Applies a transaction to the running totals, same rules as the rollups
+    def _count(self, transaction, sign):
+        amount = transaction.get("amount", 0) or 0
+        self.sums["income" if amount >= 0 else "expenses"] += sign * amount
+        self.sums["net"] += sign * amount
+        self.sums["count"] += sign
+
+    # Moves the watermarks past a transaction read from the repository
+    def _watch(self, transaction):
+        updated_at = transaction.get("updated_at")
+        if updated_at is not None and (self.since is None or updated_at > self.since):
+            self.since = updated_at
+        if self.after_id is None or transaction["_id"] > self.after_id:
+            self.after_id = transaction["_id"]
+
+    # Reads every transaction from the repository
+    def load(self):
+        # Read the version first so writes made during the load are fetched next time
+        self.version = self.repo.transactions_version()
+        self.deleted = self.repo.transactions_deleted()
+        self.rows, self.keys = {}, []
+        self.sums = {"income": 0, "expenses": 0, "net": 0, "count": 0}
+        self.since = self.after_id = None
+        for transaction in self.repo.changed_transactions():
+            self._watch(self._put(transaction, index=False))
+        # One sort instead of an insort per row
+        self.keys = sorted(page_key(t) for t in self.rows.values())
+        self.loaded = True
+
+    # Picks up writes made by other screens, processes and the microservices
+    def refresh(self):
+        """
+        Returns True if anything was fetched.
+        """
+        if not self.loaded:
+            self.load()
+            return True
+        version = self.repo.transactions_version()
+        if version == self.version:
+            return False
+        # Writers count a delete before moving the version, so this read sees it
+        if self.repo.transactions_deleted() != self.deleted:
+            self.load()
+            return True
+        for transaction in self.repo.changed_transactions(self.since, self.after_id):
+            self._watch(self._put(transaction))
+        self.version = version
+        return True
+
+    # Write-through operations, same signatures as the repository's
+    def add_transaction(self, transaction):
+        transaction_id = self.repo.add_transaction(transaction)
+        self._put({**transaction, "_id": transaction_id})
+        return transaction_id
+
+    def update_transaction(self, transaction_id, fields):
+        if not self.repo.update_transaction(transaction_id, fields):
+            self._remove(transaction_id)
+            return False
+        old = self.rows.get(transaction_id) or self.repo.get_transaction(transaction_id)
+        if old:
+            self._put({**old, **fields})
+        return True
+
+    def delete_transaction(self, transaction_id):
+        deleted = self.repo.delete_transaction(transaction_id)
+        self._remove(transaction_id)
+        self.deleted += int(deleted)
+        return deleted
+
+    def delete_transactions(self, filters):
+        deleted = self.repo.delete_transactions(filters)
+        self.deleted += deleted
+        matches = matcher(filters)
+        removed = [t["_id"] for t in self.rows.values() if matches(t)]
+        for transaction_id in removed:
+            self._remove(transaction_id)
+        if deleted != len(removed):
+            # The cache was behind the database; start over
+            self.load()
+        return deleted
+
+    # Reads, answered from memory
+    def get_transaction(self, transaction_id):
+        return self.rows.get(transaction_id)
+
+    def find_transactions(self, filters):
+        matches = matcher(filters)
+        return [self.rows[i] for _, i in self.keys if matches(self.rows[i])]
+
+    def count_transactions(self, filters):
+        if not filters:
+            return len(self.rows)
+        matches = matcher(filters)
+        return sum(1 for t in self.rows.values() if matches(t))
+
+    def all_transactions(self):
+        return list(self.rows.values())
+
+    def totals(self):
+        return dict(self.sums)
+
+    def recent_transactions(self, limit):
+        return self.transaction_page(None, None, True, limit)
+
+    # Up to limit rows before/after a (date, _id) position, see transaction_pager
+    def transaction_page(self, row, op, newest_first, limit):
+        if row is None:
+            keys = self.keys[-limit:] if newest_first else self.keys[:limit]
+        elif op == "$gt":
+            start = bisect_right(self.keys, page_key(row))
+            keys = self.keys[start:start + limit]
+        else:
+            find = bisect_right if op == "$lte" else bisect_left
+            end = find(self.keys, page_key(row))
+            keys = self.keys[max(0, end - limit):end]
+        if newest_first:
+            keys = keys[::-1]
+        return [self.rows[i] for _, i in keys]
@@ -0,0 +1,142 @@
+"""
+Transaction exporter
+
+Streams the transactions collection to a file in bounded memory:
+  - CSV, optionally gzip compressed
+  - Parquet, written in fixed-size row groups (needs pyarrow)
+
+Transactions are read through a storage repository (see storage.py); with
+MongoDB the cursor only fetches the exported fields, in batches, ordered by _id.
+In incremental mode only transactions newer than the last exported _id are
+written, and the new watermark is saved (the "export_state" collection or
+table) once the file is complete.
+
+Nightly job example:
+    python transaction_export.py --format parquet --incremental
+"""
+import argparse
+import csv
+import gzip
+from datetime import datetime
+
+BATCH_SIZE = 1000
+ROW_GROUP_SIZE = 50000
+FORMATS = ("csv", "parquet")
+
+HEADERS = ['Transaction ID', 'Date', 'Type', 'Description', 'Category', 'Amount']
+
+# Converts a transaction document to an export row
+def to_row(transaction):
+    return [
+        str(transaction['_id']),
+        transaction.get('date'),
+        transaction.get('type'),
+        transaction.get('description'),
+        transaction.get('category'),
+        transaction.get('amount'),
+    ]
+
+# Writes transactions to a CSV file, returns (row count, last _id)
+def write_csv(rows, path, compress=False):
+    count = 0
+    last_id = None
+    opener = gzip.open if compress else open
+    with opener(path, 'wt', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(HEADERS)
+        for transaction in rows:
+            writer.writerow(to_row(transaction))
+            last_id = transaction['_id']
+            count += 1
+    return count, last_id
+
+# Writes transactions to a Parquet file in row groups, returns (row count, last _id)
+def write_parquet(rows, path, row_group_size=ROW_GROUP_SIZE):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow. Install it with: pip install pyarrow")
+
+    schema = pa.schema([
+        ("transaction_id", pa.string()),
+        ("date", pa.string()),
+        ("type", pa.string()),
+        ("description", pa.string()),
+        ("category", pa.string()),
+        ("amount", pa.float64()),
+    ])
+    count = 0
+    last_id = None
+    columns = [[] for _ in schema.names]
+
+    with pq.ParquetWriter(path, schema, compression="snappy") as writer:
+        for transaction in rows:
+            for column, value in zip(columns, to_row(transaction)):
+                column.append(value)
+            last_id = transaction['_id']
+            count += 1
+            if len(columns[0]) >= row_group_size:
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                columns = [[] for _ in schema.names]
+        if columns[0] or count == 0:
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+    return count, last_id
+
+# Builds the output file name for an export
+def export_path(fmt, compress=False, incremental=False):
+    name = "transactions"
+    if incremental:
+        name += datetime.now().strftime("-%Y%m%d-%H%M%S")
+    if fmt == "parquet":
+        return name + ".parquet"
+    return name + (".csv.gz" if compress else ".csv")
+
+# Exports transactions and returns (path, row count)
+def export_transactions(store, fmt="csv", compress=False, incremental=False,
+                        path=None, batch_size=BATCH_SIZE, row_group_size=ROW_GROUP_SIZE):
+    """
+    Exports every transaction in a storage repository. With incremental=True
+    only transactions added since the last incremental export of the same
+    format are written.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    path = path or export_path(fmt, compress, incremental)
+
+    state_id = f"{fmt}{'.gz' if compress and fmt == 'csv' else ''}"
+    since_id = store.get_export_state(state_id) if incremental else None
+
+    rows = store.iter_transactions(since_id, batch_size)
+    if fmt == "parquet":
+        count, last_id = write_parquet(rows, path, row_group_size)
+    else:
+        count, last_id = write_csv(rows, path, compress)
+
+    if incremental and last_id is not None:
+        store.set_export_state(state_id, last_id)
+    return path, count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export BudgetWise transactions.")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--gzip", action="store_true", help="gzip compress CSV output")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only export transactions added since the last incremental export")
+    parser.add_argument("--output", help="output file path")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    args = parser.parse_args()
+
+    from storage import get_repository
+
+    path, count = export_transactions(
+        get_repository(),
+        fmt=args.format,
+        compress=args.gzip,
+        incremental=args.incremental,
+        path=args.output,
+        batch_size=args.batch_size,
+        row_group_size=args.row_group_size,
+    )
+    print(f"Exported {count} transaction(s) to {path}.")
@@ -0,0 +1,72 @@
+"""
+Transaction pager
+
+Keyset pagination over the transactions, newest first. Each page is fetched
+with a range condition on (date, _id) instead of skip/limit, so showing any page
+costs one indexed query of page_size documents no matter how large the ledger
+is. The pager reads through a storage repository's transaction_page() (see
+storage.py for the MongoDB and SQLite queries).
+"""
+PAGE_SIZE = 20
+
+
+class TransactionPager:
+    """
+    Holds the current page of transactions and moves between pages.
+    """
+
+    def __init__(self, store, page_size=PAGE_SIZE):
+        self.store = store
+        self.page_size = page_size
+        self.rows = []
+        self.page_number = 1
+        self.has_next = False
+
+    # Fetches up to page_size rows past a (date, _id) position in the given direction
+    def _fetch(self, row=None, op=None, newest_first=True):
+        rows = self.store.transaction_page(row, op, newest_first, self.page_size + 1)
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if not newest_first:
+            rows.reverse()
+        return rows, more
+
+    # Shows the newest page
+    def first(self):
+        self.rows, self.has_next = self._fetch()
+        self.page_number = 1
+        return self.rows
+
+    # Moves to the next (older) page; returns False when already on the last page
+    def next(self):
+        if not self.has_next or not self.rows:
+            return False
+        self.rows, self.has_next = self._fetch(self.rows[-1], "$lt")
+        self.page_number += 1
+        return True
+
+    # Moves to the previous (newer) page; returns False when already on the first page
+    def prev(self):
+        if self.page_number == 1 or not self.rows:
+            return False
+        rows, more = self._fetch(self.rows[0], "$gt", newest_first=False)
+        if not more:
+            self.first()
+            return True
+        self.rows = rows
+        self.has_next = True
+        self.page_number -= 1
+        return True
+
+    # Re-reads the current page, picking up edits, deletes and new transactions
+    def refresh(self):
+        """
+        The first page is re-read from the top so newer transactions appear on
+        it; later pages are re-read from their first row.
+        """
+        if self.page_number == 1 or not self.rows:
+            return self.first()
+        self.rows, self.has_next = self._fetch(self.rows[0], "$lte")
+        if not self.rows:
+            return self.first()
+        return self.rows
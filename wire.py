@@ -0,0 +1,89 @@
+"""
+Wire format
+
+Compact encodings for microservice replies. A client lists what it can read
+in an "accept" field and the server picks the first option it also supports:
+
+    {"accept": {"encoding": ["msgpack", "json"], "compression": ["zstd", "zlib"]}}
+
+The reply is two frames: a small JSON header describing how the payload was
+encoded, and the payload itself. Lists of transactions are sent column by
+column ({"fields": [...], "columns": [[...], ...]}) so field names are not
+repeated for every row. Payloads smaller than COMPRESS_MIN_BYTES are never
+compressed.
+
+msgpack and zstandard are optional; json and zlib always work.
+"""
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESS_MIN_BYTES = 16 * 1024
+
+# Returns the encodings this process can read and write, preferred first
+def supported_encodings():
+    return (["msgpack"] if msgpack else []) + ["json"]
+
+# Returns the compressions this process can read and write, preferred first
+def supported_compressions():
+    return (["zstd"] if zstandard else []) + ["zlib"]
+
+# Returns the "accept" field a client should send
+def accept_header():
+    return {"encoding": supported_encodings(), "compression": supported_compressions()}
+
+# Picks the (encoding, compression) to reply with from a client's accept field
+def negotiate(accept):
+    encoding = next((e for e in accept.get("encoding", []) if e in supported_encodings()), "json")
+    compression = next((c for c in accept.get("compression", []) if c in supported_compressions()), None)
+    return encoding, compression
+
+# Turns a list of documents into column arrays
+def to_columns(docs, fields):
+    return {"fields": list(fields), "columns": [[d.get(f) for d in docs] for f in fields]}
+
+# Turns column arrays back into a list of documents
+def from_columns(table):
+    fields = table["fields"]
+    return [dict(zip(fields, row)) for row in zip(*table["columns"])]
+
+# Serializes and (for large payloads) compresses a value, returns (header, payload)
+def encode(value, encoding="json", compression=None, **header):
+    if encoding == "msgpack":
+        payload = msgpack.packb(value, use_bin_type=True)
+    else:
+        payload = json.dumps(value).encode()
+
+    if compression and len(payload) >= COMPRESS_MIN_BYTES:
+        if compression == "zstd":
+            payload = zstandard.ZstdCompressor().compress(payload)
+        else:
+            payload = zlib.compress(payload, 1)
+    else:
+        compression = None
+
+    header.update({"encoding": encoding, "compression": compression})
+    return json.dumps(header).encode(), payload
+
+# Reverses encode(), returns (header, value)
+def decode(header_frame, payload):
+    header = json.loads(header_frame)
+    if header.get("compression") == "zstd":
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+    elif header.get("compression") == "zlib":
+        payload = zlib.decompress(payload)
+
+    if header.get("encoding") == "msgpack":
+        value = msgpack.unpackb(payload, raw=False)
+    else:
+        value = json.loads(payload)
+    return header, value
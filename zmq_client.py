@@ -0,0 +1,123 @@
+"""
+Shared ZeroMQ client
+
+One zmq.Context per process and one long-lived REQ socket per microservice.
+Every request has a deadline; when a reply does not arrive in time the socket
+is closed, reconnected and the request is resent (the "Lazy Pirate" pattern),
+up to a fixed number of attempts. If the service still does not answer a
+ServiceUnavailable error is raised instead of blocking forever.
+"""
+import atexit
+import json
+import threading
+
+import zmq
+
+SERVICE_ENDPOINTS = {
+    "A": "tcp://localhost:5555",
+    "B": "tcp://localhost:5557",
+    "C": "tcp://localhost:5554",
+    "D": "tcp://localhost:5552",
+}
+
+# Per-service reply deadlines in milliseconds; chart rendering gets longer
+SERVICE_TIMEOUTS_MS = {
+    "A": 5000,
+    "B": 10000,
+    "C": 15000,
+    "D": 5000,
+}
+
+REQUEST_ATTEMPTS = 3
+
+_context = None
+_clients = {}
+_lock = threading.Lock()
+
+
+class ServiceUnavailable(Exception):
+    """
+    Raised when a microservice does not reply within its deadline.
+    """
+
+
+class ServiceClient:
+    """
+    A reusable REQ socket for one endpoint with deadlines and reconnects.
+    """
+
+    def __init__(self, endpoint, timeout_ms=5000, attempts=REQUEST_ATTEMPTS):
+        self.endpoint = endpoint
+        self.timeout_ms = timeout_ms
+        self.attempts = attempts
+        self.socket = None
+        self._connect()
+
+    # Opens a fresh REQ socket to the endpoint
+    def _connect(self):
+        self.socket = get_context().socket(zmq.REQ)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.connect(self.endpoint)
+
+    # Drops a socket that is stuck waiting for a reply and opens a new one
+    def _reconnect(self):
+        self.socket.close()
+        self._connect()
+
+    # Sends a multipart request and returns the reply frames
+    def request(self, frames, timeout_ms=None, attempts=None):
+        """
+        Use attempts=1 for requests that must not be sent twice.
+        """
+        timeout_ms = self.timeout_ms if timeout_ms is None else timeout_ms
+        attempts = self.attempts if attempts is None else attempts
+
+        for _ in range(attempts):
+            self.socket.send_multipart(frames)
+            if self.socket.poll(timeout_ms, zmq.POLLIN):
+                return self.socket.recv_multipart()
+            self._reconnect()
+        raise ServiceUnavailable(
+            f"No reply from {self.endpoint} after {attempts} attempt(s)"
+        )
+
+    # Sends a JSON request and decodes the JSON reply
+    def request_json(self, message, **kwargs):
+        reply = self.request([json.dumps(message).encode()], **kwargs)
+        return json.loads(reply[0])
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+
+# Returns the process-wide ZeroMQ context
+def get_context():
+    global _context
+    if _context is None:
+        _context = zmq.Context()
+    return _context
+
+# Returns the shared client for a service name ("A", "B", "C" or "D")
+def get_client(service):
+    with _lock:
+        client = _clients.get(service)
+        if client is None:
+            client = ServiceClient(SERVICE_ENDPOINTS[service], SERVICE_TIMEOUTS_MS[service])
+            _clients[service] = client
+        return client
+
+# Closes every socket and the context
+def close_all():
+    global _context
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        if _context is not None:
+            _context.term()
+            _context = None
+
+
+atexit.register(close_all)